@@ -0,0 +1,167 @@
+"""Generate Food Tracker reports for many databases without Streamlit.
+
+Reuses the report builders the app's download buttons use and runs one
+database per worker process, so nightly batches scale across cores.
+
+Usage:
+    python FT/batch_report.py people/*/food_tracker.db --output reports
+    python FT/batch_report.py alice.db bob.db --start 2024-01-01 --end 2024-12-31
+    python FT/batch_report.py "people/*.db" --formats json --workers 8 --categories Lunch Dinner
+"""
+import argparse
+import concurrent.futures
+import datetime
+import glob
+import json
+import os
+import sys
+import time
+
+import food_data
+
+FORMATS = ['csv', 'pdf', 'json']
+
+
+def expand_databases(patterns):
+    """Expand globs (quoted ones too, for shells that don't) into a sorted,
+    de-duplicated list of existing database files. Compaction archives from
+    before they were renamed (<name>.archive.db) are left out."""
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+        paths.update(os.path.abspath(path) for path in matches
+                     if os.path.isfile(path) and not path.endswith('.archive.db'))
+    return sorted(paths)
+
+
+def output_stems(paths):
+    """Unique output file stems: each path relative to the folder the
+    databases share, so people/alice/food_tracker.db becomes alice_food_tracker"""
+    common = os.path.commonpath([os.path.dirname(path) for path in paths])
+    return {path: os.path.splitext(os.path.relpath(path, common))[0].replace(os.sep, '_') for path in paths}
+
+
+def _summary(start_date, end_date, categories):
+    """JSON summary of the active database for the range"""
+    filters = {'start_date': start_date, 'end_date': end_date, 'categories': categories}
+    _, period_totals, category_protein, _ = food_data.create_protein_charts(**filters)
+    summary = {'stats': food_data.get_stats(**filters), 'category_protein': [], 'periods': []}
+    if period_totals is not None:
+        summary['category_protein'] = category_protein.to_dict('records')
+        periods = period_totals[['date', 'protein']].assign(date=period_totals['date'].dt.strftime('%Y-%m-%d'))
+        summary['periods'] = periods.to_dict('records')
+        summary['period'] = 'week' if 'week' in period_totals else 'month'
+    return summary
+
+
+def generate_reports(path, output_dir, stem, start_date=None, end_date=None, categories=None, formats=FORMATS):
+    """Write the requested reports for one database and return what was done.
+    Runs in a worker process, so everything it needs comes in as arguments.
+    The database is only read: files in an older format are refused instead
+    of upgraded, and no snapshot is written next to them."""
+    start = time.perf_counter()
+    food_data.use_database(path)
+    food_data.SNAPSHOT_ENABLED = False
+    try:
+        # Fail before writing anything for unreadable or outdated files
+        food_data.get_pool(path, read_only=True)
+        written = []
+        if 'csv' in formats:
+            csv_path = os.path.join(output_dir, f'{stem}.csv')
+            with open(csv_path, 'w', newline='', encoding='utf-8') as csv_file:
+                for chunk in food_data.iter_daily_csv(start_date, end_date, categories):
+                    csv_file.write(chunk)
+            written.append(csv_path)
+
+        if 'pdf' in formats:
+            pdf_path = os.path.join(output_dir, f'{stem}.pdf')
+            with open(pdf_path, 'wb') as pdf_file:
+                food_data.create_pdf_report(pdf_file, start_date, end_date, categories)
+            written.append(pdf_path)
+
+        summary = _summary(start_date, end_date, categories)
+        if 'json' in formats:
+            json_path = os.path.join(output_dir, f'{stem}.json')
+            with open(json_path, 'w') as json_file:
+                json.dump({'database': path, 'start_date': start_date and str(start_date),
+                           'end_date': end_date and str(end_date), 'categories': categories, **summary},
+                          json_file, indent=2)
+            written.append(json_path)
+    finally:
+        food_data.close_pool(path)
+
+    return {
+        'database': path,
+        'entries': summary['stats']['total_entries'],
+        'files': written,
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+
+def run_batch(paths, output_dir, start_date=None, end_date=None, categories=None, formats=FORMATS,
+              workers=None, log=print):
+    """Generate reports for every database on a process pool. Returns one
+    result per database; failed ones carry an 'error' instead of 'files'."""
+    os.makedirs(output_dir, exist_ok=True)
+    stems = output_stems(paths)
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(generate_reports, path, output_dir, stems[path], start_date, end_date,
+                            categories, formats): path
+            for path in paths
+        }
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+                log(f"  {stems[path]:<30} {result['entries']:>9} entries {result['seconds']:>8.2f}s")
+            except Exception as error:
+                result = {'database': path, 'error': f"{type(error).__name__}: {error}"}
+                log(f"  {stems[path]:<30} failed: {result['error']}")
+            results.append(result)
+    return sorted(results, key=lambda result: result['database'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('databases', nargs='+', help="database files or glob patterns")
+    parser.add_argument('--start', type=datetime.date.fromisoformat, help="first day to include (YYYY-MM-DD)")
+    parser.add_argument('--end', type=datetime.date.fromisoformat, help="last day to include (YYYY-MM-DD)")
+    parser.add_argument('--categories', nargs='+', choices=food_data.MEAL_CATEGORIES,
+                        help="only include these meal categories")
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=FORMATS,
+                        help="reports to write (default: csv pdf json)")
+    parser.add_argument('--output', default='reports', help="folder for the reports (default: reports)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    for pattern in args.databases:
+        if not glob.has_magic(pattern) and not os.path.isfile(pattern):
+            print(f"Skipping {pattern}: no such file")
+    paths = expand_databases(args.databases)
+    if not paths:
+        parser.error("no database files found")
+
+    print(f"Generating reports for {len(paths)} databases into {args.output}...")
+    start = time.perf_counter()
+    results = run_batch(paths, args.output, args.start, args.end, args.categories, args.formats, args.workers)
+
+    index_path = os.path.join(args.output, 'index.json')
+    with open(index_path, 'w') as index_file:
+        json.dump({
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'start_date': args.start and str(args.start),
+            'end_date': args.end and str(args.end),
+            'categories': args.categories,
+            'results': results
+        }, index_file, indent=2)
+
+    failures = [result for result in results if 'error' in result]
+    print(f"Done in {time.perf_counter() - start:.1f}s, {len(results) - len(failures)} succeeded, "
+          f"{len(failures)} failed. Index written to {index_path}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""Benchmark the Food Tracker data paths on synthetic logs.
+
+Fills scratch SQLite databases with realistic synthetic food logs, times
+every data function and export, tracks peak Python memory, and writes a
+machine-readable JSON report that can be compared against a saved baseline.
+
+Usage:
+    python FT/benchmark.py                                  # 1k and 100k entries
+    python FT/benchmark.py --sizes 1000 100000 1000000 --output report.json
+    python FT/benchmark.py --baseline baseline.json         # exits 1 on regressions
+    python FT/benchmark.py --only transform_to_daily_table csv_export
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+import food_data
+
+DEFAULT_SIZES = [1000, 100000]
+DEFAULT_YEARS = 5
+DEFAULT_SEED = 42
+GENERATION_CHUNK = 50000
+
+# Skewed meal mix: dinners and lunches dominate, snacks are occasional
+CATEGORY_WEIGHTS = {"Breakfast": 0.22, "Lunch": 0.30, "Snacks": 0.13, "Dinner": 0.35}
+
+# Typical foods per category with a protein range in grams
+FOODS = {
+    "Breakfast": [("Oatmeal with berries", 5, 12), ("Scrambled eggs on toast", 15, 25),
+                  ("Greek yogurt and granola", 15, 22), ("Protein pancakes", 20, 35),
+                  ("Avocado toast", 6, 12), ("Bagel with cream cheese", 8, 14)],
+    "Lunch": [("Grilled chicken with rice", 35, 50), ("Turkey sandwich", 20, 30),
+              ("Tuna salad", 25, 35), ("Beef burrito bowl", 30, 45),
+              ("Lentil soup", 12, 20), ("Caesar salad", 10, 25), ("Sushi", 15, 30)],
+    "Snacks": [("Protein bar", 15, 25), ("Almonds", 5, 8), ("Apple with peanut butter", 6, 10),
+               ("Cottage cheese", 12, 20), ("Beef jerky", 10, 15)],
+    "Dinner": [("Salmon with vegetables", 30, 45), ("Steak and potatoes", 40, 60),
+               ("Pasta bolognese", 25, 40), ("Chicken stir fry", 30, 45),
+               ("Tofu curry", 15, 25), ("Homemade pizza", 20, 35), ("Pork chops", 35, 50)],
+}
+BEVERAGES = ["", "Water", "Coffee", "Tea", "Protein shake", "Orange juice", "Milk", "Soda"]
+BEVERAGE_WEIGHTS = [30, 30, 15, 8, 6, 4, 4, 3]
+MEAL_HOURS = {"Breakfast": 7, "Lunch": 12, "Snacks": 15, "Dinner": 19}
+NOTE_WORDS = ("felt full after this meal, portion was larger than usual, ate out with friends, "
+              "cooked at home, tried a new recipe, skipped dessert, post workout, very hungry, "
+              "meal prep from sunday, extra sauce, low sodium version, shared with family").split(", ")
+
+
+def generate_entries(size, years=DEFAULT_YEARS, seed=DEFAULT_SEED):
+    """Yield `size` synthetic entry tuples spread over `years` years, with
+    skewed categories, busier weekends and occasional long notes"""
+    rng = random.Random(seed)
+    categories = list(CATEGORY_WEIGHTS)
+    weights = list(CATEGORY_WEIGHTS.values())
+    first_day = datetime.date.today() - datetime.timedelta(days=365 * years)
+    days = 365 * years
+    # Weekend days get more entries than weekdays
+    day_weights = list(itertools.accumulate(
+        1.4 if (first_day + datetime.timedelta(days=offset)).weekday() >= 5 else 1.0
+        for offset in range(days)))
+
+    for number in range(size):
+        date = first_day + datetime.timedelta(days=rng.choices(range(days), cum_weights=day_weights)[0])
+        category = rng.choices(categories, weights)[0]
+        food, low, high = rng.choice(FOODS[category])
+        notes = ""
+        if rng.random() < 0.3:
+            notes = ", ".join(rng.choice(NOTE_WORDS) for _ in range(rng.randint(5, 40)))
+        created_at = datetime.datetime.combine(
+            date, datetime.time(MEAL_HOURS[category], rng.randint(0, 59), rng.randint(0, 59), number % 1000000))
+        yield (date.isoformat(), category, food, rng.choices(BEVERAGES, BEVERAGE_WEIGHTS)[0],
+               rng.randint(low, high), notes, created_at.isoformat())
+
+
+def _insert_chunk(conn, rows):
+    conn.executemany('''
+        INSERT INTO food_entries (date, category, food, beverage, protein, notes, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+
+def create_benchmark_db(path, size, years=DEFAULT_YEARS, seed=DEFAULT_SEED):
+    """Fill a scratch database with synthetic entries, reusing it when it
+    already holds the requested number of rows"""
+    if os.path.exists(path):
+        with sqlite3.connect(path) as conn:
+            if conn.execute('SELECT COUNT(*) FROM food_entries').fetchone()[0] == size:
+                return
+        food_data.close_pool(path)
+        os.remove(path)
+
+    pool = food_data.get_pool(path)
+    chunk = []
+    for row in generate_entries(size, years, seed):
+        chunk.append(row)
+        if len(chunk) == GENERATION_CHUNK:
+            pool.write(_insert_chunk, chunk)
+            chunk = []
+    if chunk:
+        pool.write(_insert_chunk, chunk)
+    pool.write(food_data.rebuild_daily_summary)
+    pool.write(food_data.rebuild_food_catalog)
+
+
+def _count(result):
+    """Row count of a benchmark result, when it has one"""
+    if isinstance(result, (list, pd.DataFrame)):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], pd.DataFrame):
+        return len(result[0])
+    return None
+
+
+def benchmark_cases():
+    """Named benchmark cases, each a callable run against the active database"""
+    month_ago = (datetime.date.today() - datetime.timedelta(days=30)).isoformat()
+
+    def uncached(function, *caches):
+        def run():
+            for cached in caches:
+                cached.cache_clear()
+            return function()
+        return run
+
+    return {
+        'get_stats': uncached(food_data.get_stats, food_data._load_stats),
+        'get_recent_entries': lambda: food_data.get_recent_entries(10),
+        'get_entries_page': lambda: food_data.get_entries_page(limit=25, categories=['Lunch']),
+        'count_entries': food_data.count_entries,
+        'suggest_foods': uncached(lambda: food_data.suggest_foods('chick'), food_data._load_food_index),
+        'search_entries': lambda: food_data.search_entries('chicken rice', categories=['Lunch']),
+        'transform_to_daily_table': food_data.transform_to_daily_table,
+        'create_protein_charts': food_data.create_protein_charts,
+        'daily_table_lunch_dinner': lambda: food_data.transform_to_daily_table(categories=['Lunch', 'Dinner']),
+        'get_goal_analytics': uncached(lambda: food_data.get_goal_analytics(130),
+                                       food_data._load_daily_category_protein, food_data._compute_goal_analytics),
+        'csv_export': lambda: ''.join(food_data.iter_daily_csv()),
+        'pdf_export': lambda: food_data.create_pdf_report().getvalue(),
+        'pdf_export_last_30_days': lambda: food_data.create_pdf_report(start_date=month_ago).getvalue(),
+        'snapshot_rebuild': food_data.rebuild_snapshot,
+        'rebuild_daily_summary': lambda: food_data.get_pool().write(food_data.rebuild_daily_summary),
+    }
+
+
+def measure(function, repeat):
+    """Time `repeat` runs, then one more under tracemalloc for peak memory"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'min_s': min(timings),
+        'median_s': statistics.median(timings),
+        'peak_mib': peak / 2 ** 20,
+        'rows': _count(result)
+    }
+
+
+def run_benchmarks(sizes, workdir, years=DEFAULT_YEARS, seed=DEFAULT_SEED, repeat=3,
+                   only=None, skip=(), log=print):
+    """Run every selected case for every size and return the report dict"""
+    report = {
+        'meta': {
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'years': years,
+            'seed': seed,
+            'repeat': repeat
+        },
+        'results': {}
+    }
+
+    for size in sizes:
+        path = os.path.join(workdir, f'bench_{size}_{years}y_{seed}.db')
+        log(f"Preparing {size} entries in {path}...")
+        start = time.perf_counter()
+        create_benchmark_db(path, size, years, seed)
+        log(f"  ready in {time.perf_counter() - start:.1f}s")
+
+        food_data.use_database(path)
+        results = report['results'][str(size)] = {}
+        for name, function in benchmark_cases().items():
+            if (only and name not in only) or name in skip:
+                continue
+            results[name] = measure(function, repeat)
+            log(f"  {name:<26} {results[name]['median_s'] * 1000:>10.1f} ms"
+                f" {results[name]['peak_mib']:>9.1f} MiB")
+        food_data.close_pool(path)
+
+    return report
+
+
+def compare(report, baseline, threshold=1.25, min_delta_s=0.005):
+    """List cases whose median time grew more than `threshold` times the baseline"""
+    regressions = []
+    for size, results in report['results'].items():
+        for name, result in results.items():
+            previous = baseline.get('results', {}).get(size, {}).get(name)
+            if not previous:
+                continue
+            if (result['median_s'] > previous['median_s'] * threshold
+                    and result['median_s'] - previous['median_s'] > min_delta_s):
+                regressions.append(f"{name} @ {size}: {previous['median_s'] * 1000:.1f} ms -> "
+                                   f"{result['median_s'] * 1000:.1f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="entry counts to benchmark (default: 1000 100000)")
+    parser.add_argument('--years', type=int, default=DEFAULT_YEARS, help="years of history to spread entries over")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="random seed for the synthetic data")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per case")
+    parser.add_argument('--only', nargs='+', help="run only these cases")
+    parser.add_argument('--skip', nargs='+', default=[], help="skip these cases")
+    parser.add_argument('--workdir', help="keep scratch databases here and reuse them between runs")
+    parser.add_argument('--output', help="write the JSON report to this file")
+    parser.add_argument('--baseline', help="compare against a previous JSON report")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="slowdown factor that counts as a regression (default: 1.25)")
+    args = parser.parse_args(argv)
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        report = run_benchmarks(args.sizes, args.workdir, args.years, args.seed, args.repeat,
+                                args.only, args.skip)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            report = run_benchmarks(args.sizes, workdir, args.years, args.seed, args.repeat,
+                                    args.only, args.skip)
+
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1868 @@
+"""Storage and analytics layer for the Food Tracker app.
+
+Everything here works without Streamlit so the app, scripts and
+benchmarks can share the same data functions.
+"""
+import datetime
+import io
+import csv
+import json
+import math
+import os
+import pathlib
+import queue
+import re
+import sqlite3
+import threading
+import time
+import shutil
+import uuid
+import weakref
+import contextlib
+import collections
+import concurrent.futures
+import functools
+import itertools
+import bisect
+import numpy as np
+import pandas as pd
+
+import profiling
+from profiling import profiled
+
+# Database setup
+def init_db(conn):
+    """Create the schema on a connection, run once per process"""
+    c = conn.cursor()
+    
+    # Create table if it doesn't exist
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS food_entries
+        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+         date TEXT NOT NULL,
+         category TEXT NOT NULL,
+         food TEXT NOT NULL,
+         beverage TEXT NOT NULL,
+         protein INTEGER DEFAULT 0,
+         notes TEXT,
+         created_at TEXT)
+    ''')
+    
+    # Covering index for date lookups and the statistics aggregates
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_food_entries_date
+        ON food_entries (date, protein)
+    ''')
+    
+    # Covering index for the per-day totals behind category filters
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_food_entries_category
+        ON food_entries (category, date, protein)
+    ''')
+    
+    # Index matching the keyset pagination order of the entry editor
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_food_entries_page
+        ON food_entries (date, IFNULL(created_at, ''), id)
+    ''')
+    
+    # Per-day rollup kept in sync by the write functions
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='daily_summary'")
+    summary_exists = c.fetchone() is not None
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS daily_summary
+        (date TEXT PRIMARY KEY,
+         breakfast TEXT NOT NULL DEFAULT '',
+         lunch TEXT NOT NULL DEFAULT '',
+         snacks TEXT NOT NULL DEFAULT '',
+         dinner TEXT NOT NULL DEFAULT '',
+         beverage TEXT NOT NULL DEFAULT '',
+         protein INTEGER NOT NULL DEFAULT 0,
+         entry_count INTEGER NOT NULL DEFAULT 0)
+    ''')
+    
+    # Backfill the rollup for databases created before it existed
+    if not summary_exists:
+        rebuild_daily_summary(conn)
+    
+    # Append-only change log: one batch per write, with the affected entries as
+    # they were before updates and deletes and as written for inserts
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS change_batches
+        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+         label TEXT NOT NULL,
+         created_at TEXT NOT NULL,
+         entries INTEGER NOT NULL DEFAULT 0,
+         undoes INTEGER)
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS change_log
+        (batch_id INTEGER NOT NULL,
+         entry_id INTEGER NOT NULL,
+         action TEXT NOT NULL,
+         date TEXT,
+         category TEXT,
+         food TEXT,
+         beverage TEXT,
+         protein INTEGER,
+         notes TEXT,
+         created_at TEXT)
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_change_log_batch ON change_log (batch_id, action)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_change_log_entry ON change_log (entry_id, batch_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_change_batches_undoes ON change_batches (undoes)')
+    
+    # Days whose entries were rolled up by compact_entries()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS compacted_days
+        (date TEXT PRIMARY KEY,
+         compacted_at TEXT NOT NULL)
+    ''')
+    
+    # Catalog of distinct foods kept in sync by the write functions
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='food_catalog'")
+    catalog_exists = c.fetchone() is not None
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_food_entries_food
+        ON food_entries (lower(trim(food)))
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS food_catalog
+        (food_key TEXT PRIMARY KEY,
+         food TEXT NOT NULL,
+         uses INTEGER NOT NULL DEFAULT 0,
+         last_used TEXT,
+         median_protein INTEGER NOT NULL DEFAULT 0)
+    ''')
+    if not catalog_exists:
+        rebuild_food_catalog(conn)
+    
+    # Full-text index over the free-text columns, kept in sync by triggers
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='food_entries_fts'")
+    search_exists = c.fetchone() is not None
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS food_entries_fts USING fts5
+        (food, beverage, notes, content='food_entries', content_rowid='id',
+         tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS food_entries_fts_insert AFTER INSERT ON food_entries BEGIN
+            INSERT INTO food_entries_fts (rowid, food, beverage, notes)
+            VALUES (new.id, new.food, new.beverage, new.notes);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS food_entries_fts_delete AFTER DELETE ON food_entries BEGIN
+            INSERT INTO food_entries_fts (food_entries_fts, rowid, food, beverage, notes)
+            VALUES ('delete', old.id, old.food, old.beverage, old.notes);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS food_entries_fts_update AFTER UPDATE ON food_entries BEGIN
+            INSERT INTO food_entries_fts (food_entries_fts, rowid, food, beverage, notes)
+            VALUES ('delete', old.id, old.food, old.beverage, old.notes);
+            INSERT INTO food_entries_fts (rowid, food, beverage, notes)
+            VALUES (new.id, new.food, new.beverage, new.notes);
+        END
+    ''')
+    
+    # Index entries that were logged before the search table existed
+    if not search_exists:
+        c.execute("INSERT INTO food_entries_fts (food_entries_fts) VALUES ('rebuild')")
+    
+    # Per-day change counters, bumped by triggers inside the writing
+    # transaction so edits made outside the app are counted too. The
+    # snapshot and precomputed results compare them for the dates they cover.
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='entry_changes'")
+    entry_changes_exist = c.fetchone() is not None
+    c.execute('CREATE TABLE IF NOT EXISTS entry_changes (date TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+    if not entry_changes_exist:
+        c.execute('INSERT INTO entry_changes SELECT date, 1 FROM food_entries GROUP BY date')
+    # Identifies the database, so a snapshot or cache of a replaced file is not reused
+    c.execute('CREATE TABLE IF NOT EXISTS snapshot_state (snapshot_id TEXT NOT NULL)')
+    c.execute('INSERT INTO snapshot_state SELECT lower(hex(randomblob(16))) '
+              'WHERE NOT EXISTS (SELECT * FROM snapshot_state)')
+    # Replaced by entry_changes
+    for action in ('insert', 'delete', 'update'):
+        c.execute(f'DROP TRIGGER IF EXISTS snapshot_dirty_{action}')
+        c.execute(f'DROP TRIGGER IF EXISTS snapshot_years_{action}')
+    c.execute('DROP TABLE IF EXISTS snapshot_dirty')
+    c.execute('DROP TABLE IF EXISTS snapshot_years')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS entry_changes_insert AFTER INSERT ON food_entries BEGIN
+            INSERT INTO entry_changes VALUES (new.date, 1)
+            ON CONFLICT (date) DO UPDATE SET version = version + 1;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS entry_changes_delete AFTER DELETE ON food_entries BEGIN
+            INSERT INTO entry_changes VALUES (old.date, 1)
+            ON CONFLICT (date) DO UPDATE SET version = version + 1;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS entry_changes_update AFTER UPDATE ON food_entries BEGIN
+            INSERT INTO entry_changes VALUES (old.date, 1)
+            ON CONFLICT (date) DO UPDATE SET version = version + 1;
+            INSERT INTO entry_changes VALUES (new.date, 1)
+            ON CONFLICT (date) DO UPDATE SET version = version + 1;
+        END
+    ''')
+
+# Daily summary maintenance
+MEAL_CATEGORIES = ["Breakfast", "Lunch", "Snacks", "Dinner"]
+DAILY_TABLE_COLUMNS = ['Date'] + MEAL_CATEGORIES + ['Beverage', 'Protein Intake']
+
+def build_daily_table(entries_df):
+    """Pivot entries into one row per day with a single groupby pass.
+    Expects date, category, food, beverage and protein columns ordered by
+    date DESC, created_at DESC, which is the order foods are joined in."""
+    if entries_df.empty:
+        return pd.DataFrame()
+    
+    by_date = entries_df.groupby('date', sort=False)
+    daily = pd.DataFrame({
+        'Protein Intake': by_date['protein'].sum().astype('int64'),
+        'entry_count': by_date.size()
+    })
+    
+    meals = entries_df[entries_df['category'].isin(MEAL_CATEGORIES)]
+    foods = meals.groupby(['date', 'category'], sort=False)['food'].agg(', '.join).unstack('category')
+    daily = daily.join(foods.reindex(columns=MEAL_CATEGORIES))
+    
+    drinks = entries_df[entries_df['beverage'].fillna('') != '']
+    daily['Beverage'] = drinks.groupby('date', sort=False)['beverage'].agg(', '.join)
+    
+    daily = daily.fillna('').sort_index(ascending=False)
+    daily.index.name = 'Date'
+    return daily.reset_index()[DAILY_TABLE_COLUMNS + ['entry_count']]
+
+def _read_entries_for_summary(conn, where='', params=()):
+    """Read the columns the daily table needs, typed, in daily table order"""
+    return pd.read_sql(f'''
+        SELECT date, category, food, beverage, COALESCE(protein, 0) AS protein
+        FROM food_entries {where}
+        ORDER BY date DESC, created_at DESC
+    ''', conn, params=params, dtype={'protein': 'int64'})
+
+def _write_daily_summary(conn, daily):
+    """Upsert rows produced by build_daily_table into daily_summary"""
+    if daily.empty:
+        return
+    conn.executemany('INSERT OR REPLACE INTO daily_summary VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     daily.itertuples(index=False, name=None))
+
+def refresh_daily_summary(conn, dates):
+    """Recompute the daily_summary rows for the given dates.
+    Runs inside the caller's transaction, the caller commits."""
+    dates = sorted(set(dates))
+    placeholders = ', '.join('?' * len(dates))
+    conn.execute(f'DELETE FROM daily_summary WHERE date IN ({placeholders})', dates)
+    entries_df = _read_entries_for_summary(conn, f'WHERE date IN ({placeholders})', dates)
+    _write_daily_summary(conn, build_daily_table(entries_df))
+
+def rebuild_daily_summary(conn):
+    """Rebuild the whole daily_summary table from food_entries in one pass"""
+    conn.execute('DELETE FROM daily_summary')
+    _write_daily_summary(conn, build_daily_table(_read_entries_for_summary(conn)))
+
+# Food catalog maintenance
+def build_food_catalog(entries_df):
+    """One row per normalized food name with its use count, last used date
+    and median protein. The display name is the most recently logged spelling."""
+    entries_df = entries_df[entries_df['food_key'] != '']
+    if entries_df.empty:
+        return pd.DataFrame(columns=['food_key', 'food', 'uses', 'last_used', 'median_protein'])
+    
+    by_food = entries_df.groupby('food_key', sort=False)
+    return pd.DataFrame({
+        'food': by_food['food'].last().str.strip(),
+        'uses': by_food.size(),
+        'last_used': by_food['date'].max(),
+        'median_protein': by_food['protein'].median().round().astype('int64')
+    }).reset_index()
+
+def _read_entries_for_catalog(conn, where='', params=()):
+    """Read the columns the food catalog needs, oldest first. Compacted days
+    are left out, their rows list several foods at once."""
+    return pd.read_sql(f'''
+        SELECT lower(trim(food)) AS food_key, food, date, COALESCE(protein, 0) AS protein
+        FROM food_entries
+        WHERE date NOT IN (SELECT date FROM compacted_days) {where}
+        ORDER BY date, IFNULL(created_at, '')
+    ''', conn, params=params, dtype={'protein': 'int64'})
+
+def _write_food_catalog(conn, catalog):
+    if catalog.empty:
+        return
+    conn.executemany('INSERT OR REPLACE INTO food_catalog VALUES (?, ?, ?, ?, ?)',
+                     catalog[['food_key', 'food', 'uses', 'last_used', 'median_protein']]
+                     .itertuples(index=False, name=None))
+
+def refresh_food_catalog(conn, foods):
+    """Recompute the food_catalog rows for the given food names.
+    Runs inside the caller's transaction, the caller commits."""
+    foods = sorted(set(foods))
+    keys = ', '.join('lower(trim(?))' for _ in foods)
+    conn.execute(f'DELETE FROM food_catalog WHERE food_key IN ({keys})', foods)
+    entries_df = _read_entries_for_catalog(conn, f'AND lower(trim(food)) IN ({keys})', foods)
+    _write_food_catalog(conn, build_food_catalog(entries_df))
+
+def rebuild_food_catalog(conn):
+    """Rebuild the whole food_catalog table from food_entries in one pass"""
+    conn.execute('DELETE FROM food_catalog')
+    _write_food_catalog(conn, build_food_catalog(_read_entries_for_catalog(conn)))
+
+# Connection management
+DB_PATH = os.environ.get('FOOD_TRACKER_DB', 'food_tracker.db')
+USERS_DIR = os.environ.get('FOOD_TRACKER_USERS_DIR')  # One database per user under this folder
+USER_NAME_PATTERN = re.compile(r'[a-z0-9][a-z0-9._@+-]{0,127}')
+# Files whose caches, pools and precomputers are kept. Files used within
+# the last IDLE_DATABASE_SECONDS keep theirs even beyond the limit, so
+# people taking turns never reopen each other's pools.
+CACHED_DATABASES = int(os.environ.get('FOOD_TRACKER_CACHED_DATABASES', 8))
+IDLE_DATABASE_SECONDS = 300
+BUSY_TIMEOUT_MS = 5000
+READ_POOL_SIZE = 4
+_pool_generations = itertools.count()
+
+def _connect(path, read_only=False, **kwargs):
+    """Open a connection with the pragmas every connection shares"""
+    if read_only:
+        path = f'{pathlib.Path(path).absolute().as_uri()}?mode=ro'
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False, uri=read_only, **kwargs)
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous = NORMAL')  # Durable enough with WAL, no fsync per commit
+    conn.execute('PRAGMA cache_size = -16000')  # 16 MB page cache
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+class ConnectionPool:
+    """Pooled read connections and a single writer thread for one database file.
+    
+    The database runs in WAL mode, so readers never block each other or the
+    writer. Writes from every session go through one queue and run one at a
+    time on the writer thread, each in its own transaction.
+    
+    A read_only pool opens the file as it is: it neither creates nor
+    upgrades the schema, and its writes fail."""
+    
+    def __init__(self, path, size=READ_POOL_SIZE, read_only=False):
+        self.path = path
+        self._writer = _connect(path, read_only, isolation_level=None)
+        if read_only:
+            try:
+                _check_schema(self._writer, path)
+            except ValueError:
+                self._writer.close()
+                raise
+        else:
+            # Must come before the first table is created, so only new databases
+            # get it; older ones are converted by reclaim_space()
+            self._writer.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            self._writer.execute('PRAGMA journal_mode = WAL')
+        self._writes = queue.Queue()
+        self._readers = queue.Queue()
+        for _ in range(size):
+            self._readers.put(_connect(path, read_only))
+        self._version_conn = _connect(path, read_only)
+        self._version_lock = threading.Lock()
+        # Versions restart with every connection, tell pools for the same path apart
+        self._generation = next(_pool_generations)
+        self._write_listeners = []
+        self._state_lock = threading.Lock()
+        self._active = 0  # Reads and writes in progress
+        self.closed = False
+        self.last_used = time.monotonic()  # Of the last get_pool() call for it
+        
+        # Schema setup runs once, when the pool is created
+        if not read_only:
+            self._run_write(init_db, ())
+        self._writer_thread = threading.Thread(target=self._write_loop, name='food-tracker-writer', daemon=True)
+        self._writer_thread.start()
+    
+    def _enter(self):
+        """Count an operation in progress. False once the pool is closed."""
+        with self._state_lock:
+            if self.closed:
+                return False
+            self._active += 1
+            return True
+    
+    def _exit(self):
+        with self._state_lock:
+            self._active -= 1
+    
+    @contextlib.contextmanager
+    def reader(self):
+        """Borrow a read connection for the duration of a with block"""
+        if not self._enter():
+            # Evicted while the caller held on to it, use the file's current pool
+            with get_pool(self.path).reader() as conn:
+                yield conn
+            return
+        conn = self._readers.get()
+        sql_span = profiling.begin('sql', 'sql')
+        if sql_span is not None:
+            conn.set_trace_callback(sql_span.add_statement)
+        try:
+            yield conn
+        finally:
+            if sql_span is not None:
+                conn.set_trace_callback(None)
+                profiling.end(sql_span)
+            self._readers.put(conn)
+            self._exit()
+    
+    def write(self, operation, *args, transaction=True):
+        """Run operation(conn, *args) on the writer thread and return its result.
+        With transaction=False it runs in autocommit mode, for statements such
+        as VACUUM that cannot run inside a transaction."""
+        if not self._enter():
+            return get_pool(self.path).write(operation, *args, transaction=transaction)
+        try:
+            future = concurrent.futures.Future()
+            with profiling.span(f'write {operation.__name__}', 'sql'):
+                self._writes.put((operation, args, transaction, future))
+                return future.result()
+        finally:
+            self._exit()
+    
+    def add_write_listener(self, callback):
+        """Call callback() on the writer thread after every committed write.
+        It should return quickly, the next write waits for it."""
+        self._write_listeners.append(callback)
+    
+    def remove_write_listener(self, callback):
+        with contextlib.suppress(ValueError):
+            self._write_listeners.remove(callback)
+    
+    def data_version(self):
+        """PRAGMA data_version of a dedicated connection, paired with the pool's
+        generation. It changes whenever any other connection commits, including
+        writers in other processes."""
+        with self._version_lock:
+            if not self.closed:
+                return (self._generation, self._version_conn.execute('PRAGMA data_version').fetchone()[0])
+        return get_pool(self.path).data_version()
+    
+    def retire(self):
+        """Mark the pool closed if no read or write is in progress, so later
+        calls go to a new pool. Returns whether it was retired; close() it then."""
+        with self._state_lock:
+            if self._active or self.closed:
+                return False
+            self.closed = True
+            return True
+    
+    def _run_write(self, operation, args, transaction=True):
+        """Run one write operation inside an immediate transaction"""
+        if not transaction:
+            return operation(self._writer, *args)
+        self._writer.execute('BEGIN IMMEDIATE')
+        try:
+            result = operation(self._writer, *args)
+        except BaseException:
+            self._writer.execute('ROLLBACK')
+            raise
+        self._writer.execute('COMMIT')
+        return result
+    
+    def close(self):
+        """Stop the writer thread once queued writes finish and close every connection"""
+        with self._state_lock:
+            self.closed = True
+        self._writes.put(None)
+        self._writer_thread.join()
+        for _ in range(self._readers.qsize()):
+            self._readers.get().close()
+        with self._version_lock:
+            self._version_conn.close()
+        self._writer.close()
+    
+    def _write_loop(self):
+        """Writer thread: apply queued writes one at a time"""
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            operation, args, transaction, future = item
+            try:
+                result = self._run_write(operation, args, transaction)
+            except Exception as error:
+                future.set_exception(error)
+                continue
+            for listener in self._write_listeners:
+                with contextlib.suppress(Exception):  # A broken listener must not stop the writer
+                    listener()
+            future.set_result(result)
+
+@functools.lru_cache(maxsize=1)
+def _schema_objects():
+    """Names of the tables, indexes and triggers init_db creates"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        init_db(conn)
+        return frozenset(row[0] for row in conn.execute('SELECT name FROM sqlite_master'))
+    finally:
+        conn.close()
+
+def _check_schema(conn, path):
+    """Raise ValueError unless a database has the current schema"""
+    try:
+        names = {row[0] for row in conn.execute('SELECT name FROM sqlite_master')}
+    except sqlite3.DatabaseError as error:
+        raise ValueError(f"{path} is not a Food Tracker database: {error}")
+    if not _schema_objects() <= names:
+        raise ValueError(f"{path} uses an older database format, open it in the app once to upgrade it")
+
+_pools = collections.OrderedDict()  # Least recently used first
+_opening_pools = {}  # path -> Event set once its pool is opened
+_pools_lock = threading.Lock()
+
+_session = threading.local()
+
+def use_database(path):
+    """Point the data functions at another database file"""
+    global DB_PATH
+    DB_PATH = path
+
+def use_session_database(path):
+    """Point the data functions called from the current thread at a database
+    file, overriding DB_PATH, so concurrent sessions can each work on their
+    own user's file. None goes back to DB_PATH."""
+    _session.path = path
+
+def current_database():
+    """Database file the data functions use on this thread"""
+    return getattr(_session, 'path', None) or DB_PATH
+
+def user_database(user, users_dir=None):
+    """Database file of a user, users_dir/<user>/food_tracker.db, with its
+    folder created. Raises ValueError for names that are not safe as folder names."""
+    user = str(user).strip().lower()
+    if not USER_NAME_PATTERN.fullmatch(user):
+        raise ValueError(f"invalid user name {user!r}")
+    folder = os.path.join(users_dir or USERS_DIR, user)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, 'food_tracker.db')
+
+def list_users(users_dir=None):
+    """Users that have a database under users_dir"""
+    users_dir = users_dir or USERS_DIR
+    if not users_dir or not os.path.isdir(users_dir):
+        return []
+    return sorted(name for name in os.listdir(users_dir)
+                  if os.path.isfile(os.path.join(users_dir, name, 'food_tracker.db')))
+
+def database_cache(maxsize):
+    """functools.lru_cache with a separate cache per database file (the first
+    argument), so one user's reads never evict another's. Beyond the
+    CACHED_DATABASES most recently used files, the caches of files idle for
+    IDLE_DATABASE_SECONDS are dropped."""
+    def decorator(function):
+        caches = collections.OrderedDict()  # path -> (cache, last used)
+        lock = threading.Lock()
+        
+        @functools.wraps(function)
+        def wrapper(path, *args):
+            now = time.monotonic()
+            with lock:
+                cache, _ = caches.pop(path, (None, None))
+                cache = cache or functools.lru_cache(maxsize)(functools.partial(function, path))
+                caches[path] = (cache, now)
+                for old_path, (_, last_used) in list(caches.items())[:-1]:
+                    if len(caches) <= CACHED_DATABASES or now - last_used < IDLE_DATABASE_SECONDS:
+                        break
+                    del caches[old_path]
+            return cache(*args)
+        
+        def cache_clear(path=None):
+            with lock:
+                if path is None:
+                    caches.clear()
+                else:
+                    caches.pop(path, None)
+        
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+def _retire_idle_pools():
+    """Retire the least recently used pools beyond CACHED_DATABASES that have
+    been idle for IDLE_DATABASE_SECONDS. Call with _pools_lock held and
+    close() the returned pools after releasing it."""
+    now = time.monotonic()
+    retired = []
+    for old_path, old_pool in list(_pools.items())[:-1]:
+        if len(_pools) <= CACHED_DATABASES or now - old_pool.last_used < IDLE_DATABASE_SECONDS:
+            break
+        if old_pool.retire():
+            del _pools[old_path]
+            retired.append(old_pool)
+    return retired
+
+def get_pool(path=None, read_only=False):
+    """Connection pool for a database file, shared by every session. Like
+    the caches, pools are kept for the CACHED_DATABASES most recently used
+    files, and for every file used within IDLE_DATABASE_SECONDS; older ones
+    are closed once idle and reopened when needed.
+    read_only applies when the pool is opened, see ConnectionPool."""
+    path = path or current_database()
+    while True:
+        with _pools_lock:
+            pool = _pools.pop(path, None)
+            opening = _opening_pools.get(path)
+            if pool is not None:
+                pool.last_used = time.monotonic()
+                _pools[path] = pool
+                retired = _retire_idle_pools()
+                break
+            if opening is None:
+                opening = _opening_pools[path] = threading.Event()
+                break
+        # Another session is opening it, wait without holding up other files
+        opening.wait()
+    
+    if pool is None:
+        # Opening runs the schema setup, which can take a while on an old
+        # file, so it happens outside the lock every session needs
+        try:
+            pool = ConnectionPool(path, read_only=read_only)
+        finally:
+            with _pools_lock:
+                del _opening_pools[path]
+                if pool is not None:
+                    _pools[path] = pool
+                    retired = _retire_idle_pools()
+            opening.set()
+    for old_pool in retired:
+        old_pool.close()
+    return pool
+
+def close_pool(path=None):
+    """Close and forget the pool for a database file"""
+    with _pools_lock:
+        pool = _pools.pop(path or current_database(), None)
+    if pool:
+        pool.close()
+
+def get_data_version():
+    """Current data version, changes after every committed write"""
+    return get_pool().data_version()
+
+def get_range_version(start_date=None, end_date=None):
+    """Version of the entries dated in a range. Changes when any connection
+    adds, edits or deletes an entry in the range and stays the same for
+    writes elsewhere, so results for a range can outlive unrelated writes."""
+    clauses, params = _entry_filters(start_date, end_date)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with get_pool().reader() as conn:
+        return conn.execute(f'''
+            SELECT (SELECT snapshot_id FROM snapshot_state), COUNT(*), IFNULL(SUM(version), 0)
+            FROM entry_changes {where}
+        ''', params).fetchone()
+
+# Database functions
+@profiled('db')
+def get_recent_entries(limit=10, start_date=None, end_date=None, categories=None):
+    """Get the most recent entries matching the optional filters without
+    loading the whole table"""
+    clauses, params = _entry_filters(start_date, end_date, categories)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with get_pool().reader() as conn:
+        c = conn.execute(f'''
+            SELECT id, date, category, food, beverage, protein, notes, created_at
+            FROM food_entries {where} ORDER BY date DESC, created_at DESC LIMIT ?
+        ''', (*params, limit))
+        columns = [column[0] for column in c.description]
+        return [dict(zip(columns, row)) for row in c.fetchall()]
+
+def _entry_filters(start_date=None, end_date=None, categories=None):
+    """Build WHERE clauses and parameters for the optional entry filters"""
+    clauses = []
+    params = []
+    if start_date:
+        clauses.append('date >= ?')
+        params.append(str(start_date))
+    if end_date:
+        clauses.append('date <= ?')
+        params.append(str(end_date))
+    if categories:
+        clauses.append(f"category IN ({', '.join('?' * len(categories))})")
+        params.extend(categories)
+    return clauses, params
+
+def _daily_totals(start_date=None, end_date=None, categories=None):
+    """SQL and parameters for one (date, protein, entry_count) row per day
+    matching the filters. Reads daily_summary unless a category filter needs
+    the entries themselves."""
+    clauses, params = _entry_filters(start_date, end_date, categories)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    if categories:
+        return f'''
+            SELECT date, COALESCE(SUM(protein), 0) AS protein, COUNT(*) AS entry_count
+            FROM food_entries {where} GROUP BY date
+        ''', params
+    return f'SELECT date, protein, entry_count FROM daily_summary {where}', params
+
+@profiled('db')
+def get_entries_page(after=None, limit=25, start_date=None, end_date=None, categories=None):
+    """Get one page of entries, newest first, using keyset pagination.
+    `after` is the page key of the last row on the previous page."""
+    clauses, params = _entry_filters(start_date, end_date, categories)
+    if after:
+        clauses.append("(date, IFNULL(created_at, ''), id) < (?, ?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with get_pool().reader() as conn:
+        c = conn.execute(f'''
+            SELECT id, date, category, food, beverage, protein, notes, created_at
+            FROM food_entries {where}
+            ORDER BY date DESC, IFNULL(created_at, '') DESC, id DESC LIMIT ?
+        ''', (*params, limit))
+        columns = [column[0] for column in c.description]
+        return [dict(zip(columns, row)) for row in c.fetchall()]
+
+def entry_page_key(entry):
+    """Keyset pagination key for an entry returned by get_entries_page"""
+    return (entry['date'], entry['created_at'] or '', entry['id'])
+
+@profiled('db')
+def count_entries(start_date=None, end_date=None, categories=None):
+    """Count entries matching the optional filters"""
+    clauses, params = _entry_filters(start_date, end_date, categories)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with get_pool().reader() as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM food_entries {where}', params).fetchone()[0]
+
+# Column weights for ranking search matches: food, beverage, notes
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+
+def build_search_query(text):
+    """Turn free text into an FTS5 query that matches every word as a prefix.
+    Words are quoted so FTS5 operators in the input are searched literally."""
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+@profiled('db')
+def search_entries(text, limit=50, start_date=None, end_date=None, categories=None):
+    """Search food, beverage and notes, best matches first"""
+    query = build_search_query(text)
+    if not query:
+        return []
+    
+    clauses, params = _entry_filters(start_date, end_date, categories)
+    where = ''.join(f' AND {clause}' for clause in clauses)
+    with get_pool().reader() as conn:
+        c = conn.execute(f'''
+            SELECT e.id, e.date, e.category, e.food, e.beverage, e.protein, e.notes, e.created_at
+            FROM food_entries_fts JOIN food_entries e ON e.id = food_entries_fts.rowid
+            WHERE food_entries_fts MATCH ?{where}
+            ORDER BY bm25(food_entries_fts, ?, ?, ?), e.date DESC LIMIT ?
+        ''', (query, *params, *SEARCH_WEIGHTS, limit))
+        columns = [column[0] for column in c.description]
+        return [dict(zip(columns, row)) for row in c.fetchall()]
+
+class FoodIndex:
+    """In-memory prefix index over the food catalog. Every word of a name is
+    indexed, so "chick" finds "Grilled chicken with rice" as well."""
+    
+    def __init__(self, foods):
+        # Foods arrive ranked by uses then last use, so list position is the rank
+        self.foods = foods
+        self._entries = sorted(
+            (' '.join(words[start:]), rank)
+            for rank, words in enumerate(food['food_key'].split() for food in foods)
+            for start in range(len(words))
+        )
+        self._keys = [key for key, _ in self._entries]
+    
+    def suggest(self, text, limit=8):
+        """Foods whose name or any word in it starts with `text`, names that
+        start with it first, then by how often and how recently they were used"""
+        prefix = ' '.join(text.lower().split())
+        if not prefix:
+            return []
+        matches = set()
+        for key, rank in self._entries[bisect.bisect_left(self._keys, prefix):]:
+            if not key.startswith(prefix):
+                break
+            matches.add(rank)
+        ranked = sorted(matches, key=lambda rank: (not self.foods[rank]['food_key'].startswith(prefix), rank))
+        return [self.foods[rank] for rank in ranked[:limit]]
+
+@database_cache(maxsize=1)
+def _load_food_index(path, data_version):
+    """Build the food prefix index once per database and data version"""
+    with get_pool(path).reader() as conn:
+        c = conn.execute('''
+            SELECT food_key, food, uses, last_used, median_protein FROM food_catalog
+            ORDER BY uses DESC, last_used DESC
+        ''')
+        columns = [column[0] for column in c.description]
+        return FoodIndex([dict(zip(columns, row)) for row in c.fetchall()])
+
+@profiled('db')
+def suggest_foods(text, limit=8):
+    """Ranked food catalog suggestions for partly typed text"""
+    return _load_food_index(current_database(), get_data_version()).suggest(text, limit)
+
+@database_cache(maxsize=8)
+def _load_stats(path, data_version, today, start_date=None, end_date=None, categories=()):
+    """Run the statistics aggregate once per database, data version, day and filters"""
+    week_ago = (datetime.date.fromisoformat(today) - datetime.timedelta(days=7)).isoformat()
+    daily_sql, params = _daily_totals(start_date, end_date, categories)
+    with get_pool(path).reader() as conn:
+        total_entries, unique_dates, total_protein, today_entries, week_entries = conn.execute(f'''
+            SELECT COALESCE(SUM(entry_count), 0),
+                   COUNT(*),
+                   COALESCE(SUM(protein), 0),
+                   COALESCE(SUM(CASE WHEN date = ? THEN entry_count END), 0),
+                   COALESCE(SUM(CASE WHEN date >= ? THEN entry_count END), 0)
+            FROM ({daily_sql})
+        ''', (today, week_ago, *params)).fetchone()
+        latest = conn.execute(f'SELECT date, protein FROM ({daily_sql}) ORDER BY date DESC LIMIT 1',
+                              params).fetchone()
+    return {
+        'total_entries': total_entries,
+        'unique_dates': unique_dates,
+        'total_protein': total_protein,
+        'avg_daily_protein': total_protein / unique_dates if unique_dates > 0 else 0,
+        'today_entries': today_entries,
+        'week_entries': week_entries,
+        'latest_date': latest[0] if latest else None,
+        'latest_protein': latest[1] if latest else 0
+    }
+
+@profiled('db')
+def get_stats(start_date=None, end_date=None, categories=None):
+    """Get summary statistics computed by SQL aggregates, optionally limited
+    to a date range and meal categories"""
+    return _load_stats(current_database(), get_data_version(), datetime.date.today().isoformat(),
+                       start_date, end_date, tuple(categories or ()))
+
+# Write operations run on the pool's writer thread inside one transaction.
+# Each one is recorded as a batch in the change log so it can be undone.
+SUMMARY_REBUILD_THRESHOLD = 500  # Rebuild instead of refreshing when this many days or foods change
+
+def _refresh_derived_tables(conn, dates, foods):
+    """Bring the daily summary and food catalog up to date for changed days
+    and foods, rebuilding them instead when many changed"""
+    if len(dates) > SUMMARY_REBUILD_THRESHOLD:
+        rebuild_daily_summary(conn)
+    elif dates:
+        refresh_daily_summary(conn, dates)
+    if len(foods) > SUMMARY_REBUILD_THRESHOLD:
+        rebuild_food_catalog(conn)
+    elif foods:
+        refresh_food_catalog(conn, foods)
+
+def _begin_change_batch(conn, label, undoes=None):
+    """Start a change log batch and return its id"""
+    return conn.execute('''
+        INSERT INTO change_batches (label, created_at, undoes) VALUES (?, ?, ?)
+    ''', (label, datetime.datetime.now().isoformat(timespec='seconds'), undoes)).lastrowid
+
+def _log_changes(conn, batch_id, action, where, params=()):
+    """Copy the entries matching `where` into the change log: as they are
+    before an update or delete, as they were written after an insert"""
+    count = conn.execute(f'''
+        INSERT INTO change_log (batch_id, entry_id, action, date, category, food, beverage, protein, notes, created_at)
+        SELECT ?, id, ?, date, category, food, beverage, protein, notes, created_at
+        FROM food_entries WHERE {where}
+    ''', (batch_id, action, *params)).rowcount
+    conn.execute('UPDATE change_batches SET entries = entries + ? WHERE id = ?', (count, batch_id))
+
+def _add_entry(conn, entry):
+    batch_id = _begin_change_batch(conn, f"Added {entry['food']}")
+    entry_id = conn.execute('''
+        INSERT INTO food_entries (date, category, food, beverage, protein, notes, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (entry['date'], entry['category'], entry['food'], entry['beverage'], 
+          entry['protein'], entry.get('notes', ''), entry['created_at'])).lastrowid
+    _log_changes(conn, batch_id, 'insert', 'id = ?', (entry_id,))
+    refresh_daily_summary(conn, [entry['date']])
+    refresh_food_catalog(conn, [entry['food']])
+
+def _apply_edits(conn, updates, deletes, label=None):
+    """Apply updates ({entry_id: entry}) and deletes (entry ids) as one change
+    batch with a single refresh of the derived tables. An entry that is both
+    updated and deleted is deleted. Returns how many entries changed."""
+    deletes = set(deletes)
+    updates = {entry_id: entry for entry_id, entry in updates.items() if entry_id not in deletes}
+    ids = sorted(set(updates) | deletes)
+    if not ids:
+        return 0
+    
+    previous = conn.execute(f"SELECT date, food FROM food_entries WHERE id IN ({', '.join('?' * len(ids))})",
+                            ids).fetchall()
+    if label is None:
+        if len(previous) == 1:
+            label = f"{'Deleted' if deletes else 'Edited'} {previous[0][1]}"
+        else:
+            label = f"Edited {len(updates)} and deleted {len(deletes)} entries"
+    batch_id = _begin_change_batch(conn, label)
+    if updates:
+        _log_changes(conn, batch_id, 'update', f"id IN ({', '.join('?' * len(updates))})", list(updates))
+        conn.executemany('''
+            UPDATE food_entries 
+            SET date=?, category=?, food=?, beverage=?, protein=?, notes=?
+            WHERE id=?
+        ''', [(entry['date'], entry['category'], entry['food'], entry['beverage'],
+               entry['protein'], entry.get('notes', ''), entry_id) for entry_id, entry in updates.items()])
+    if deletes:
+        _log_changes(conn, batch_id, 'delete', f"id IN ({', '.join('?' * len(deletes))})", list(deletes))
+        conn.executemany('DELETE FROM food_entries WHERE id=?', [(entry_id,) for entry_id in deletes])
+    
+    _refresh_derived_tables(conn, {row[0] for row in previous} | {entry['date'] for entry in updates.values()},
+                            {row[1] for row in previous} | {entry['food'] for entry in updates.values()})
+    return len(previous)
+
+def _clear_all_entries(conn):
+    batch_id = _begin_change_batch(conn, "Cleared all entries")
+    _log_changes(conn, batch_id, 'delete', '1')
+    conn.execute('DELETE FROM food_entries')
+    conn.execute('DELETE FROM daily_summary')
+    conn.execute('DELETE FROM food_catalog')
+
+def _later_change_in_effect(conn, batch_id):
+    """Label of a later batch that touched the same entries and is still in
+    effect, or None. A batch and the undo that reverses it cancel out, so
+    what counts is the last batch of each undo chain: an original change or
+    a redo (odd position in the chain) is in effect, an undo is not."""
+    later = conn.execute('''
+        SELECT DISTINCT batches.id, batches.label FROM change_log AS logged
+        JOIN change_log AS later ON later.entry_id = logged.entry_id AND later.batch_id > logged.batch_id
+        JOIN change_batches AS batches ON batches.id = later.batch_id
+        WHERE logged.batch_id = ?
+          AND batches.id NOT IN (SELECT undoes FROM change_batches WHERE undoes IS NOT NULL)
+        ORDER BY batches.id
+    ''', (batch_id,)).fetchall()
+    for later_id, label in later:
+        position = 1
+        undoes = conn.execute('SELECT undoes FROM change_batches WHERE id = ?', (later_id,)).fetchone()[0]
+        while undoes is not None:
+            position += 1
+            row = conn.execute('SELECT undoes FROM change_batches WHERE id = ?', (undoes,)).fetchone()
+            undoes = row[0] if row else None
+        if position % 2:
+            return label
+    return None
+
+def _undo_change_batch(conn, batch_id):
+    """Reverse a change batch, recording the reversal as a new batch so it
+    can be undone too. Refuses when a later change touched the same entries."""
+    batch = conn.execute('SELECT label FROM change_batches WHERE id = ?', (batch_id,)).fetchone()
+    if batch is None:
+        raise ValueError(f"no change {batch_id}")
+    if conn.execute('SELECT 1 FROM change_batches WHERE undoes = ?', (batch_id,)).fetchone():
+        raise ValueError(f"\"{batch[0]}\" was already undone")
+    later = _later_change_in_effect(conn, batch_id)
+    if later:
+        raise ValueError(f"\"{later}\" changed the same entries later, undo it first")
+    
+    in_batch = "id IN (SELECT entry_id FROM change_log WHERE batch_id = ? AND action = ?)"
+    changed = conn.execute(f"SELECT date, food FROM food_entries WHERE {in_batch} OR {in_batch}",
+                           (batch_id, 'insert', batch_id, 'update')).fetchall()
+    changed += conn.execute("SELECT date, food FROM change_log WHERE batch_id = ? AND action != 'insert'",
+                            (batch_id,)).fetchall()
+    
+    label = f"Redo {batch[0][len('Undo '):]}" if batch[0].startswith('Undo ') else f"Undo {batch[0]}"
+    undo_id = _begin_change_batch(conn, label, undoes=batch_id)
+    _log_changes(conn, undo_id, 'delete', in_batch, (batch_id, 'insert'))
+    reversed_rows = collections.Counter()
+    reversed_rows['insert'] = conn.execute(f'DELETE FROM food_entries WHERE {in_batch}',
+                                           (batch_id, 'insert')).rowcount
+    _log_changes(conn, undo_id, 'update', in_batch, (batch_id, 'update'))
+    reversed_rows['update'] = conn.execute(f'''
+        UPDATE food_entries SET (date, category, food, beverage, protein, notes, created_at) = (
+            SELECT date, category, food, beverage, protein, notes, created_at FROM change_log
+            WHERE batch_id = ? AND action = 'update' AND entry_id = food_entries.id
+        ) WHERE {in_batch}
+    ''', (batch_id, batch_id, 'update')).rowcount
+    try:
+        reversed_rows['delete'] = conn.execute('''
+            INSERT INTO food_entries (id, date, category, food, beverage, protein, notes, created_at)
+            SELECT entry_id, date, category, food, beverage, protein, notes, created_at FROM change_log
+            WHERE batch_id = ? AND action = 'delete'
+        ''', (batch_id,)).rowcount
+    except sqlite3.IntegrityError:
+        reversed_rows['delete'] = -1  # An entry with the same id exists again
+    _log_changes(conn, undo_id, 'insert', in_batch, (batch_id, 'delete'))
+    
+    # Entries changed outside the change log (e.g. by another tool) can't be
+    # matched up; the caller's transaction rolls the partial reversal back
+    logged = collections.Counter(dict(conn.execute(
+        'SELECT action, COUNT(*) FROM change_log WHERE batch_id = ? GROUP BY action', (batch_id,))))
+    if +reversed_rows != logged:
+        raise ValueError(f"the entries of \"{batch[0]}\" were changed outside the app, nothing was undone")
+    
+    _refresh_derived_tables(conn, {row[0] for row in changed}, {row[1] for row in changed})
+
+@profiled('db')
+def add_entry(entry):
+    """Add a new entry to database"""
+    get_pool().write(_add_entry, entry)
+
+@profiled('db')
+def update_entry(entry_id, entry):
+    """Update an existing entry"""
+    get_pool().write(_apply_edits, {entry_id: entry}, ())
+
+@profiled('db')
+def delete_entry(entry_id):
+    """Delete an entry from database"""
+    get_pool().write(_apply_edits, {}, (entry_id,))
+
+@profiled('db')
+def apply_edits(updates, deletes, label=None):
+    """Apply a batch of staged updates ({entry_id: entry}) and deletes in one
+    transaction. Returns how many entries changed."""
+    return get_pool().write(_apply_edits, updates, deletes, label)
+
+@profiled('db')
+def clear_all_entries():
+    """Clear all entries from database. The entries are kept in the change
+    log, so this can be undone."""
+    get_pool().write(_clear_all_entries)
+
+@profiled('db')
+def undo_change(batch_id):
+    """Undo a change batch from get_change_history(). Raises ValueError when
+    it was already undone or later changes touched the same entries."""
+    get_pool().write(_undo_change_batch, batch_id)
+
+@profiled('db')
+def get_change_history(limit=10):
+    """Most recent change batches, newest first, with whether they were undone"""
+    with get_pool().reader() as conn:
+        rows = conn.execute('''
+            SELECT id, label, created_at, entries, undoes,
+                   EXISTS (SELECT 1 FROM change_batches AS undo WHERE undo.undoes = batches.id)
+            FROM change_batches AS batches
+            WHERE entries > 0
+            ORDER BY id DESC LIMIT ?
+        ''', (limit,)).fetchall()
+    
+    return [{
+        'id': row[0],
+        'label': row[1],
+        'created_at': row[2],
+        'entries': row[3],
+        'undoes': row[4],
+        'undone': bool(row[5])
+    } for row in rows]
+
+# Bulk import
+IMPORT_BATCH_SIZE = 1000
+
+def _daily_row_to_entries(row):
+    """Turn a row of the daily table CSV export back into entries.
+    Each non-empty meal column becomes one entry. The day's beverages and
+    protein go on the first one so the daily table re-exports unchanged."""
+    entries = []
+    for category in MEAL_CATEGORIES:
+        if row.get(category):
+            entries.append({
+                'date': row['Date'],
+                'category': category,
+                'food': row[category],
+                'beverage': '',
+                'protein': 0,
+                'notes': '',
+                'created_at': f"{row['Date']}T00:00:0{MEAL_CATEGORIES.index(category)}"
+            })
+    if entries:
+        entries[0]['beverage'] = row.get('Beverage', '')
+        entries[0]['protein'] = row.get('Protein Intake', 0)
+    else:
+        # Nothing to attach the beverages and protein to, let validation report it
+        entries.append({'date': row['Date'], 'category': '', 'food': ''})
+    return entries
+
+def read_import_file(name, data):
+    """Parse a legacy JSON log or a CSV file into a list of raw entry dicts.
+    CSV files may be entry-level (one row per entry) or the app's own
+    daily table export."""
+    text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    if name.lower().endswith('.json'):
+        payload = json.loads(text) if text.strip() else []
+        if isinstance(payload, dict):
+            payload = payload.get('entries', [])
+        if not isinstance(payload, list):
+            raise ValueError("expected a list of entries or an object with an \"entries\" list")
+        return payload
+    
+    reader = csv.DictReader(io.StringIO(text))
+    if set(DAILY_TABLE_COLUMNS) <= set(reader.fieldnames or []):
+        return [entry for row in reader for entry in _daily_row_to_entries(row)]
+    return [{key.strip().lower(): value for key, value in row.items() if key} for row in reader]
+
+def validate_entry_record(record):
+    """Normalize one raw entry record (a dict as found in imports and API
+    payloads) into an insert tuple, or raise ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError("not an object")
+    try:
+        date = datetime.date.fromisoformat(str(record.get('date', '')).strip()[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"invalid date {record.get('date')!r}")
+    category = str(record.get('category') or '').strip().title()
+    if category not in MEAL_CATEGORIES:
+        raise ValueError(f"unknown category {record.get('category')!r}")
+    food = str(record.get('food') or '').strip()
+    if not food:
+        raise ValueError("missing food")
+    try:
+        protein = float(record.get('protein') or 0)
+        if not math.isfinite(protein):
+            raise ValueError
+        protein = int(protein)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"invalid protein {record.get('protein')!r}")
+    if protein < 0:
+        raise ValueError("negative protein")
+    if protein >= 2 ** 63:  # Largest SQLite integer
+        raise ValueError(f"protein {record.get('protein')!r} is too large")
+    beverage = str(record.get('beverage') or '').strip()
+    notes = str(record.get('notes') or '')
+    created_at = str(record.get('created_at') or f"{date}T00:00:00")
+    return (date, category, food, beverage, protein, notes, created_at)
+
+def _insert_import_rows(conn, rows, label="Imported entries"):
+    """Insert validated rows in one transaction as one change batch, skipping
+    any whose natural key (date, category, food, created_at) already exists.
+    Returns one flag per row telling whether it was inserted."""
+    if not rows:
+        return []
+    
+    existing = set(conn.execute('''
+        SELECT date, category, food, IFNULL(created_at, '') FROM food_entries
+        WHERE date BETWEEN ? AND ?
+    ''', (min(row[0] for row in rows), max(row[0] for row in rows))))
+    new_rows = []
+    inserted = []
+    for row in rows:
+        key = (row[0], row[1], row[2], row[6])
+        inserted.append(key not in existing)
+        if inserted[-1]:
+            existing.add(key)
+            new_rows.append(row)
+    
+    if not new_rows:
+        return inserted
+    
+    batch_id = _begin_change_batch(conn, label)
+    last_id = conn.execute('SELECT IFNULL(MAX(id), 0) FROM food_entries').fetchone()[0]
+    conn.executemany('''
+        INSERT INTO food_entries (date, category, food, beverage, protein, notes, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', new_rows)
+    _log_changes(conn, batch_id, 'insert', 'id > ?', (last_id,))
+    
+    _refresh_derived_tables(conn, {row[0] for row in new_rows}, {row[2] for row in new_rows})
+    return inserted
+
+@profiled('db')
+def add_entry_batches(batches):
+    """Insert several batches of validated rows in one transaction, so writers
+    with many small batches pay for a single commit. Returns how many rows of
+    each batch were new."""
+    inserted = get_pool().write(_insert_import_rows, [row for batch in batches for row in batch],
+                                "Received entries from the ingest API")
+    counts = []
+    for batch in batches:
+        counts.append(sum(inserted[:len(batch)]))
+        inserted = inserted[len(batch):]
+    return counts
+
+@profiled('db')
+def import_entries(records, progress=None, batch_size=IMPORT_BATCH_SIZE):
+    """Validate raw entry records in batches and insert them in a single
+    transaction. `progress(fraction, message)` is called as work proceeds.
+    Returns counts of imported, duplicate and invalid records."""
+    rows = []
+    errors = []
+    undated = collections.Counter()  # Records per day without their own created_at
+    total = len(records)
+    for start in range(0, total, batch_size):
+        for number, record in enumerate(records[start:start + batch_size], start=start + 1):
+            try:
+                row = validate_entry_record(record)
+            except ValueError as error:
+                errors.append(f"Record {number}: {error}")
+                continue
+            if not record.get('created_at'):
+                # Number the stamped records of each day, so repeated items
+                # in one file are kept while importing the file again is
+                # still recognised
+                if undated[row[0]]:
+                    row = row[:6] + (f"{row[6]}.{undated[row[0]]:06d}",)
+                undated[row[0]] += 1
+            rows.append(row)
+        if progress:
+            done = min(start + batch_size, total)
+            progress(0.8 * done / total, f"Validated {done} of {total} records")
+    
+    if progress:
+        progress(0.8, f"Inserting {len(rows)} entries...")
+    imported = sum(get_pool().write(_insert_import_rows, rows, f"Imported {len(rows)} records"))
+    if progress:
+        progress(1.0, "Import complete")
+    
+    return {
+        'imported': imported,
+        'duplicates': len(rows) - imported,
+        'invalid': len(errors),
+        'errors': errors
+    }
+
+@profiled('report')
+def create_pdf_report(output=None, start_date=None, end_date=None, categories=None, chunk_size=500):
+    """Create a PDF report of food entries, optionally limited to a date range
+    and meal categories.
+    Rows are fetched from the cursor in chunks and drawn page by page."""
+    from reportlab.lib.pagesizes import letter  # Loaded on first use, it is slow to import
+    from reportlab.pdfgen import canvas
+    
+    buffer = output if output is not None else io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+    
+    # Title
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(100, height - 100, "Food Tracker Report")
+    c.setFont("Helvetica", 12)
+    c.drawString(100, height - 130, f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    y_position = height - 145
+    if start_date or end_date:
+        c.drawString(100, y_position, f"Entries from {start_date or 'the beginning'} to {end_date or 'today'}")
+        y_position -= 15
+    if categories:
+        c.drawString(100, y_position, f"Meals: {', '.join(categories)}")
+        y_position -= 15
+    
+    # Table headers
+    y_position = min(height - 170, y_position - 10)
+    headers = ["Date", "Category", "Food", "Beverage", "Protein (g)"]
+    col_positions = [50, 120, 220, 350, 450]
+    
+    c.setFont("Helvetica-Bold", 10)
+    for i, header in enumerate(headers):
+        c.drawString(col_positions[i], y_position, header)
+    
+    y_position -= 20
+    
+    # Data rows
+    clauses, params = _entry_filters(start_date, end_date, categories)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    c.setFont("Helvetica", 9)
+    with get_pool().reader() as conn:
+        cursor = conn.execute(f'''
+            SELECT date, category, food, beverage, protein FROM food_entries {where}
+            ORDER BY date DESC, created_at DESC
+        ''', params)
+        for rows in iter(lambda: cursor.fetchmany(chunk_size), []):
+            for date, category, food, beverage, protein in rows:
+                if y_position < 100:  # New page if needed
+                    c.showPage()
+                    y_position = height - 100
+                    # Redraw headers on new page
+                    c.setFont("Helvetica-Bold", 10)
+                    for i, header in enumerate(headers):
+                        c.drawString(col_positions[i], y_position, header)
+                    y_position -= 20
+                    c.setFont("Helvetica", 9)
+            
+                c.drawString(col_positions[0], y_position, date)
+                c.drawString(col_positions[1], y_position, category)
+                c.drawString(col_positions[2], y_position, food[:30])
+                c.drawString(col_positions[3], y_position, beverage[:20])
+                c.drawString(col_positions[4], y_position, str(protein if protein is not None else 0))
+                y_position -= 15
+    
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+def iter_daily_csv(start_date=None, end_date=None, categories=None, chunk_size=1000):
+    """Stream the daily table as CSV text, one chunk of rows at a time.
+    Produces the same text as transform_to_daily_table().to_csv(index=False)."""
+    if categories:
+        # Category tables are built from the entries in the range, not the rollup
+        yield transform_to_daily_table(start_date, end_date, categories).to_csv(index=False)
+        return
+    
+    clauses, params = _entry_filters(start_date, end_date)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    chunk = io.StringIO()
+    writer = csv.writer(chunk, lineterminator='\n')
+    with get_pool().reader() as conn:
+        cursor = conn.execute(f'''
+            SELECT date, breakfast, lunch, snacks, dinner, beverage, protein
+            FROM daily_summary {where} ORDER BY date DESC
+        ''', params)
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            yield '\n'
+            return
+        
+        writer.writerow(DAILY_TABLE_COLUMNS)
+        while rows:
+            writer.writerows(rows)
+            yield chunk.getvalue()
+            chunk.seek(0)
+            chunk.truncate()
+            rows = cursor.fetchmany(chunk_size)
+
+@profiled('report')
+def transform_to_daily_table(start_date=None, end_date=None, categories=None):
+    """Transform data into your desired table format, optionally limited to a
+    date range and meal categories"""
+    clauses, params = _entry_filters(start_date, end_date, categories)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    if categories:
+        # The rollup has no per-category rows, build the table from the entries
+        if SNAPSHOT_ENABLED:
+            entries_df = _snapshot_entries_for_summary(start_date, end_date, categories)
+        else:
+            with get_pool().reader() as conn:
+                entries_df = _read_entries_for_summary(conn, where, params)
+        daily_df = build_daily_table(entries_df)
+        return daily_df.drop(columns='entry_count') if not daily_df.empty else daily_df
+    
+    with get_pool().reader() as conn:
+        daily_df = pd.read_sql(f'''
+            SELECT date AS "Date", breakfast AS "Breakfast", lunch AS "Lunch",
+                   snacks AS "Snacks", dinner AS "Dinner", beverage AS "Beverage",
+                   protein AS "Protein Intake"
+            FROM daily_summary {where} ORDER BY date DESC
+        ''', conn, params=params, dtype={'Protein Intake': 'int64'})
+    if daily_df.empty:
+        return pd.DataFrame()
+    
+    return daily_df
+
+# Chart data
+CHART_MAX_POINTS = 1000  # Longest trend series sent to the browser
+CHART_WEBGL_MIN_POINTS = 500  # Trend series at least this long are drawn with WebGL
+MAX_PERIOD_BARS = 104  # Period totals switch from weeks to months past this many bars
+RESOLUTION_FREQS = {'day': 'D', 'week': 'W', 'month': 'MS'}
+
+def chart_resolution(start_date, end_date):
+    """Pick day, week or month buckets for the length of a date range"""
+    days = (end_date - start_date).days + 1
+    if days <= 180:
+        return 'day'
+    if days <= 3 * 366:
+        return 'week'
+    return 'month'
+
+def downsample_lttb(df, x, y, threshold):
+    """Reduce a series to `threshold` rows with Largest-Triangle-Three-Buckets,
+    which keeps the first and last points and the visually important peaks"""
+    n = len(df)
+    if threshold < 3 or n <= threshold:
+        return df
+    
+    xs = df[x].to_numpy()
+    if np.issubdtype(xs.dtype, np.datetime64):
+        xs = xs.astype('int64')
+    xs = xs.astype('float64')
+    ys = df[y].to_numpy(dtype='float64')
+    # threshold - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    
+    keep = [0]
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        following = slice(stop, edges[bucket + 2]) if bucket + 2 < len(edges) else slice(n - 1, n)
+        average_x, average_y = xs[following].mean(), ys[following].mean()
+        areas = np.abs((xs[selected] - average_x) * (ys[start:stop] - ys[selected])
+                       - (xs[selected] - xs[start:stop]) * (average_y - ys[selected]))
+        selected = start + int(areas.argmax())
+        keep.append(selected)
+    keep.append(n - 1)
+    return df.iloc[keep].reset_index(drop=True)
+
+@profiled('report')
+def create_protein_charts(start_date=None, end_date=None, categories=None, resolution='auto',
+                          max_points=CHART_MAX_POINTS):
+    """Create protein intake visualization data with a bounded number of points.
+    Returns the trend (average daily protein per day, week or month), period
+    totals (a 'week' or, for long ranges, 'month' column), protein per category and the
+    trend resolution used."""
+    daily_sql, daily_params = _daily_totals(start_date, end_date, categories)
+    clauses, params = _entry_filters(start_date, end_date, categories)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with get_pool().reader() as conn:
+        daily_protein = pd.read_sql(f'SELECT date, protein FROM ({daily_sql}) ORDER BY date',
+                                    conn, params=daily_params, parse_dates=['date'])
+        category_protein = pd.read_sql(f'''
+            SELECT category, SUM(protein) AS protein FROM food_entries {where}
+            GROUP BY category ORDER BY category
+        ''', conn, params=params)
+    if daily_protein.empty:
+        return None, None, None, None
+    
+    if resolution == 'auto':
+        resolution = chart_resolution(daily_protein['date'].iloc[0], daily_protein['date'].iloc[-1])
+    if resolution == 'day':
+        trend = downsample_lttb(daily_protein, 'date', 'protein', max_points)
+    else:
+        trend = (daily_protein.groupby(pd.Grouper(key='date', freq=RESOLUTION_FREQS[resolution]))['protein']
+                 .mean().dropna().round(1).reset_index())
+    
+    period_freq = 'W'
+    if (daily_protein['date'].iloc[-1] - daily_protein['date'].iloc[0]).days > MAX_PERIOD_BARS * 7:
+        period_freq = 'MS'
+    period_totals = daily_protein.groupby(pd.Grouper(key='date', freq=period_freq))['protein'].sum().reset_index()
+    if period_freq == 'W':
+        period_totals['week'] = period_totals['date'].dt.strftime('Week of %b %d, %Y')
+    else:
+        period_totals['month'] = period_totals['date'].dt.strftime('%B %Y')
+    
+    return trend, period_totals, category_protein, resolution
+
+# Analytics snapshot: food_entries as typed, columnar Arrow files, one per year.
+# Files are written uncompressed in the Arrow IPC format so they can be
+# memory-mapped and read without copying.
+SNAPSHOT_ENABLED = os.environ.get('FOOD_TRACKER_SNAPSHOT', '1') != '0'
+SNAPSHOT_COLUMNS = ['id', 'date', 'category', 'food', 'beverage', 'protein', 'created_at']
+
+def snapshot_dir(path=None):
+    """Directory holding the snapshot partitions of a database"""
+    return f"{path or current_database()}.snapshot"
+
+def _arrow_entries(rows):
+    """Arrow table of entry rows with real dates and dictionary-encoded text columns"""
+    import pyarrow as pa
+    
+    columns = list(zip(*rows)) if rows else [[] for _ in SNAPSHOT_COLUMNS]
+    return pa.table({
+        'id': pa.array(columns[0], pa.int64()),
+        'date': pa.array(columns[1], pa.string()).cast(pa.date32()),
+        'category': pa.array(columns[2], pa.string()).dictionary_encode(),
+        'food': pa.array(columns[3], pa.string()).dictionary_encode(),
+        'beverage': pa.array(columns[4], pa.string()).dictionary_encode(),
+        'protein': pa.array(columns[5], pa.int32()),
+        'created_at': pa.array(columns[6], pa.string())
+    })
+
+def _snapshot_partition(conn, year):
+    """Read one year of entries for its snapshot partition"""
+    return _arrow_entries(conn.execute('''
+        SELECT id, date, category, food, beverage, COALESCE(protein, 0), IFNULL(created_at, '')
+        FROM food_entries WHERE date >= ? AND date < ?
+    ''', (f'{year}-01-01', f'{int(year) + 1:04d}-01-01')).fetchall())
+
+def _read_partition(partition):
+    """Memory-map a partition file, or None when it is missing or unreadable"""
+    import pyarrow as pa
+    
+    try:
+        return pa.ipc.open_file(pa.memory_map(partition)).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+def _refresh_snapshot(conn, directory):
+    """Memory-map the partition of every year, first rewriting those built
+    from an older version of the year or from another database. Only reads
+    the database, in one transaction so year versions and rows agree.
+    Returns {year: table} for the years that have entries."""
+    import pyarrow as pa
+    
+    os.makedirs(directory, exist_ok=True)
+    partitions = {}
+    conn.execute('BEGIN')
+    try:
+        snapshot_id = conn.execute('SELECT snapshot_id FROM snapshot_state').fetchone()[0]
+        # Day counters only grow and days are only added, so the count and
+        # total of a year's counters change whenever one of its days does
+        for year, days, total in conn.execute('''
+            SELECT substr(date, 1, 4) AS year, COUNT(*), SUM(version) FROM entry_changes
+            GROUP BY year ORDER BY year
+        ''').fetchall():
+            partition = os.path.join(directory, f'year={year}.arrow')
+            stamp = {b'snapshot_id': snapshot_id.encode(), b'version': f'{days}.{total}'.encode()}
+            table = _read_partition(partition)
+            if table is None or table.schema.metadata != stamp:
+                table = _snapshot_partition(conn, year).replace_schema_metadata(stamp)
+                if not table.num_rows:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(partition)
+                    continue
+                # Replace atomically, readers keep their mapping of the old file
+                temporary = f'{partition}.{uuid.uuid4().hex}.tmp'
+                with pa.OSFile(temporary, 'wb') as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+                os.replace(temporary, partition)
+                table = _read_partition(partition)
+            partitions[year] = table
+    finally:
+        conn.execute('ROLLBACK')
+    return partitions
+
+_snapshot_locks = {}
+
+@database_cache(maxsize=1)
+def _load_snapshot(path, data_version):
+    """Refresh stale partitions and memory-map every partition, once per data version"""
+    # One refresh per database at a time, the others then find it up to date
+    with _snapshot_locks.setdefault(path, threading.Lock()), get_pool(path).reader() as conn:
+        return _refresh_snapshot(conn, snapshot_dir(path))
+
+_snapshot_refresher = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='food-tracker-snapshot')
+_pending_snapshot_refreshes = set()
+_pending_snapshot_lock = threading.Lock()
+_watched_pools = weakref.WeakSet()
+
+def _watch_snapshot(pool):
+    """Refresh the snapshot after the pool's writes, from its first snapshot
+    read on. Processes that never read the snapshot never write one."""
+    with _pending_snapshot_lock:
+        if pool in _watched_pools:
+            return
+        _watched_pools.add(pool)
+    pool.add_write_listener(functools.partial(_schedule_snapshot_refresh, pool.path))
+
+def _schedule_snapshot_refresh(path):
+    """Write listener: bring the snapshot up to date off the writer thread,
+    so the next read finds it ready. A burst of writes shares one refresh."""
+    with _pending_snapshot_lock:
+        if path in _pending_snapshot_refreshes:
+            return
+        _pending_snapshot_refreshes.add(path)
+    _snapshot_refresher.submit(_run_snapshot_refresh, path)
+
+def _run_snapshot_refresh(path):
+    with _pending_snapshot_lock:
+        _pending_snapshot_refreshes.discard(path)
+    with _pools_lock:
+        pool = _pools.get(path)
+    if pool is None:  # Closed since the write
+        return
+    with contextlib.suppress(Exception):  # Reads refresh it themselves if this fails
+        _load_snapshot(path, pool.data_version())
+
+def rebuild_snapshot(path=None):
+    """Drop a database's analytics snapshot and write it again from scratch.
+    Returns the years that have entries."""
+    path = path or current_database()
+    with _snapshot_locks.setdefault(path, threading.Lock()):
+        shutil.rmtree(snapshot_dir(path), ignore_errors=True)
+        _load_snapshot.cache_clear(path)
+    return sorted(_load_snapshot(path, get_pool(path).data_version()))
+
+def load_snapshot(start_date=None, end_date=None, categories=None, columns=None, path=None):
+    """Entries matching the filters as an Arrow table read from the snapshot.
+    Only the partitions of the years in the range are touched."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    
+    path = path or current_database()
+    pool = get_pool(path)
+    _watch_snapshot(pool)
+    partitions = _load_snapshot(path, pool.data_version())
+    first_year = str(start_date)[:4] if start_date else '0000'
+    last_year = str(end_date)[:4] if end_date else '9999'
+    tables = [table for year, table in partitions.items() if first_year <= year <= last_year]
+    if not tables:
+        return _arrow_entries([]).select(columns or SNAPSHOT_COLUMNS)
+    # Each year has its own dictionaries, group_by needs them to agree
+    table = pa.concat_tables(tables, promote_options='permissive').unify_dictionaries()
+    
+    condition = None
+    if start_date:
+        condition = pc.field('date') >= pa.scalar(datetime.date.fromisoformat(str(start_date)), pa.date32())
+    if end_date:
+        before_end = pc.field('date') <= pa.scalar(datetime.date.fromisoformat(str(end_date)), pa.date32())
+        condition = before_end if condition is None else condition & before_end
+    if categories:
+        in_categories = pc.field('category').isin(list(categories))
+        condition = in_categories if condition is None else condition & in_categories
+    if condition is not None:
+        table = table.filter(condition)
+    return table.select(columns or SNAPSHOT_COLUMNS)
+
+def _snapshot_entries_for_summary(start_date=None, end_date=None, categories=None):
+    """Snapshot counterpart of _read_entries_for_summary: the daily table
+    columns as plain strings, in daily table order"""
+    import pyarrow as pa
+    
+    table = load_snapshot(start_date, end_date, categories,
+                          ['date', 'category', 'food', 'beverage', 'protein', 'created_at'])
+    table = table.cast(pa.schema([
+        ('date', pa.string()), ('category', pa.string()), ('food', pa.string()),
+        ('beverage', pa.string()), ('protein', pa.int64()), ('created_at', pa.string())
+    ]))
+    entries_df = table.sort_by([('date', 'descending'), ('created_at', 'descending')]).to_pandas()
+    return entries_df.drop(columns='created_at')
+
+# Rolling goal analytics
+ROLLING_LOOKBACK_DAYS = 29  # Days read before a range so the first 30-day average is complete
+
+@database_cache(maxsize=2)
+def _load_daily_category_protein(path, data_version, start_date=None, end_date=None):
+    """Protein per category for every day in the range plus the rolling
+    lookback, with days that have no entries filled with zero"""
+    if start_date:
+        start_date = datetime.date.fromisoformat(str(start_date)) - datetime.timedelta(days=ROLLING_LOOKBACK_DAYS)
+    if SNAPSHOT_ENABLED:
+        table = load_snapshot(start_date, end_date, columns=['date', 'category', 'protein'], path=path)
+        rows = (table.group_by(['date', 'category']).aggregate([('protein', 'sum')])
+                .rename_columns(['date', 'category', 'protein']).to_pandas(date_as_object=False))
+        rows['category'] = rows['category'].astype(str)
+    else:
+        clauses, params = _entry_filters(start_date, end_date)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with get_pool(path).reader() as conn:
+            rows = pd.read_sql(f'''
+                SELECT date, category, SUM(protein) AS protein FROM food_entries {where}
+                GROUP BY date, category
+            ''', conn, params=params, parse_dates=['date'])
+    if rows.empty:
+        return None
+    
+    daily = rows.pivot_table(index='date', columns='category', values='protein', aggfunc='sum', fill_value=0)
+    daily = daily.reindex(pd.date_range(daily.index.min(), daily.index.max(), freq='D', name='date'),
+                          fill_value=0)
+    daily.columns.name = None
+    return daily
+
+@database_cache(maxsize=8)
+def _compute_goal_analytics(path, data_version, goal, start_date=None, end_date=None, categories=()):
+    """Moving averages and streaks once per data version, goal and filters"""
+    daily = _load_daily_category_protein(path, data_version, start_date, end_date)
+    if daily is None:
+        return None
+    if categories:
+        daily = daily.reindex(columns=list(categories), fill_value=0)
+    
+    protein = daily.sum(axis=1)
+    hit = protein >= goal
+    # Count consecutive hits: every miss starts a new group, cumsum counts within it
+    streaks = hit.astype(int).groupby((~hit).cumsum()).cumsum()
+    trend = pd.DataFrame({
+        'protein': protein,
+        'avg_7d': protein.rolling(7, min_periods=1).mean().round(1),
+        'avg_30d': protein.rolling(30, min_periods=1).mean().round(1),
+        'goal_hit': hit,
+        'streak': streaks
+    })
+    category_trends = daily.rolling(30, min_periods=1).mean().round(1)
+    
+    # Drop the lookback days now that the windows are filled
+    if start_date:
+        trend = trend[trend.index >= pd.Timestamp(start_date)]
+        category_trends = category_trends[category_trends.index >= pd.Timestamp(start_date)]
+    if trend.empty:
+        return None
+    
+    hit = trend['goal_hit']
+    
+    def adherence(freq):
+        periods = hit.resample(freq).agg(['sum', 'count'])
+        periods.columns = ['days_hit', 'days']
+        periods['adherence_pct'] = (periods['days_hit'] / periods['days'] * 100).round(1)
+        return periods.reset_index()
+    
+    return {
+        'trend': trend.reset_index(),
+        'weekly_adherence': adherence('W'),
+        'monthly_adherence': adherence('MS'),
+        'category_trends': category_trends.reset_index(),
+        'avg_7d': float(trend['avg_7d'].iloc[-1]),
+        'avg_30d': float(trend['avg_30d'].iloc[-1]),
+        'current_streak': int(trend['streak'].iloc[-1]),
+        'longest_streak': int(trend['streak'].max()),
+        'adherence_pct': round(float(hit.mean()) * 100, 1)
+    }
+
+@profiled('report')
+def get_goal_analytics(goal, start_date=None, end_date=None, categories=None):
+    """Rolling protein analytics against a daily goal. Days are filled in up to
+    the last logged day and streaks are counted from the start of the loaded
+    window. Results are cached per data version, goal and filters, so changing
+    the goal does not query the database again (treat as read-only)."""
+    return _compute_goal_analytics(current_database(), get_data_version(), goal, start_date, end_date,
+                                   tuple(categories or ()))
+
+# Retention: entries older than the horizon are rolled up into one row per
+# day and meal category, optionally keeping the raw rows in an archive file
+RETENTION_DAYS = int(os.environ.get('FOOD_TRACKER_RETENTION_DAYS', 730))
+COMPACT_BATCH_DAYS = 31
+VACUUM_STEP_PAGES = 512
+
+def archive_path(path=None):
+    """Archive database file that compacted entries are moved to. It doesn't
+    end in .db, so globs for people's databases don't pick it up."""
+    return f"{path or current_database()}.archive"
+
+def _days_to_compact(conn, before):
+    """Days before the cutoff with a meal category that has several rows or notes"""
+    return [row[0] for row in conn.execute('''
+        SELECT DISTINCT date FROM (
+            SELECT date FROM food_entries WHERE date < ?
+            GROUP BY date, category
+            HAVING COUNT(*) > 1 OR MAX(IFNULL(notes, '')) != ''
+        ) ORDER BY date
+    ''', (before,))]
+
+def _open_archive(path):
+    """Connection to the archive of a database, created on first use.
+    Archives used to be named <name>.archive.db, those are renamed first."""
+    legacy = f"{os.path.splitext(path)[0]}.archive.db"
+    if os.path.exists(legacy) and not os.path.exists(archive_path(path)):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(legacy + suffix):
+                os.replace(legacy + suffix, archive_path(path) + suffix)
+    archive = _connect(archive_path(path))
+    archive.execute('PRAGMA journal_mode = WAL')
+    archive.execute('''
+        CREATE TABLE IF NOT EXISTS food_entries
+        (id INTEGER PRIMARY KEY,
+         date TEXT NOT NULL,
+         category TEXT NOT NULL,
+         food TEXT NOT NULL,
+         beverage TEXT NOT NULL,
+         protein INTEGER DEFAULT 0,
+         notes TEXT,
+         created_at TEXT,
+         archived_at TEXT NOT NULL)
+    ''')
+    archive.commit()
+    return archive
+
+def _archive_entries(archive, rows):
+    """Copy raw entry rows into the archive database. Commits before the
+    compaction does; rows that were already archived are kept."""
+    archived_at = datetime.datetime.now().isoformat(timespec='seconds')
+    with archive:
+        archive.executemany('INSERT OR IGNORE INTO food_entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            [(*row, archived_at) for row in rows])
+
+def _compact_days(conn, dates, archive=None):
+    """Replace each day's entries with one row per run of consecutive entries
+    of the same meal category (usually one per meal), holding their foods and
+    beverages joined in daily table order and their summed protein. Runs keep
+    the order of foods and beverages across meals, so daily tables, charts and
+    totals come out the same, with or without category filters."""
+    placeholders = ', '.join('?' * len(dates))
+    rows = conn.execute(f'''
+        SELECT id, date, category, food, beverage, protein, notes, created_at
+        FROM food_entries WHERE date IN ({placeholders})
+        ORDER BY date, created_at DESC
+    ''', dates).fetchall()
+    if archive:
+        _archive_entries(archive, rows)
+    
+    compacted = []
+    for _, run in itertools.groupby(rows, key=lambda row: (row[1], row[2])):
+        run = list(run)
+        compacted.append((
+            run[0][1], run[0][2],
+            ', '.join(row[3] for row in run),
+            ', '.join(row[4] for row in run if row[4]),
+            sum(row[5] or 0 for row in run),
+            '',
+            run[0][7]  # The newest, so the row sorts where its run did
+        ))
+    
+    conn.executemany('DELETE FROM food_entries WHERE id = ?', [(row[0],) for row in rows])
+    # Changes to the rolled-up entries can no longer be undone
+    batches = {batch for row in rows
+               for batch, in conn.execute('SELECT batch_id FROM change_log WHERE entry_id = ?', (row[0],))}
+    _drop_change_batches(conn, batches)
+    conn.executemany('''
+        INSERT INTO food_entries (date, category, food, beverage, protein, notes, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', compacted)
+    compacted_at = datetime.datetime.now().isoformat(timespec='seconds')
+    conn.executemany('INSERT OR REPLACE INTO compacted_days VALUES (?, ?)', [(date, compacted_at) for date in dates])
+    refresh_daily_summary(conn, dates)
+    return {row[3] for row in rows}, len(rows), len(compacted)
+
+def _drop_change_batches(conn, batch_ids):
+    batch_ids = [(batch_id,) for batch_id in batch_ids]
+    conn.executemany('DELETE FROM change_log WHERE batch_id = ?', batch_ids)
+    conn.executemany('DELETE FROM change_batches WHERE id = ?', batch_ids)
+
+def _prune_change_log(conn, before):
+    """Drop change batches recorded before a date"""
+    _drop_change_batches(conn, [row[0] for row in conn.execute(
+        'SELECT id FROM change_batches WHERE created_at < ?', (before,))])
+
+@profiled('db')
+def compact_entries(before=None, archive=False, progress=None):
+    """Roll up entries logged before `before` (default: RETENTION_DAYS ago)
+    into one row per day and meal (per run of consecutive entries of a meal
+    when meals interleave), dropping their notes. With archive=True the raw
+    rows are first copied to archive_path(). Days are
+    compacted a batch at a time so other writes are never held up for long,
+    and the food catalog is refreshed once at the end.
+    Change history recorded before the cutoff is dropped as well.
+    Returns counts of compacted days, removed rows and rows written."""
+    before = str(before or datetime.date.today() - datetime.timedelta(days=RETENTION_DAYS))
+    with get_pool().reader() as conn:
+        dates = _days_to_compact(conn, before)
+    
+    foods = set()
+    removed = written = 0
+    archive_conn = _open_archive(current_database()) if archive and dates else None
+    try:
+        for start in range(0, len(dates), COMPACT_BATCH_DAYS):
+            batch = dates[start:start + COMPACT_BATCH_DAYS]
+            batch_foods, batch_removed, batch_written = get_pool().write(_compact_days, batch, archive_conn)
+            foods |= batch_foods
+            removed += batch_removed
+            written += batch_written
+            if progress:
+                done = start + len(batch)
+                progress(done / len(dates), f"Compacted {done} of {len(dates)} days")
+    finally:
+        if archive_conn:
+            archive_conn.close()
+    if foods:
+        get_pool().write(refresh_food_catalog, foods)
+    get_pool().write(_prune_change_log, before)
+    
+    return {'days': len(dates), 'removed': removed, 'written': written,
+            'archive': archive_path() if archive and dates else None}
+
+def _vacuum_state(conn):
+    return {name: conn.execute(f'PRAGMA {name}').fetchone()[0]
+            for name in ('auto_vacuum', 'freelist_count', 'page_count', 'page_size')}
+
+def _incremental_vacuum(conn, pages):
+    # execute() steps a PRAGMA only once, executescript() runs it to the end
+    conn.executescript(f'PRAGMA incremental_vacuum({pages})')
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+def _convert_to_incremental_vacuum(conn):
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+@profiled('db')
+def reclaim_space(step_pages=VACUUM_STEP_PAGES):
+    """Return free pages to the file system. Incremental vacuum frees
+    step_pages per write, so other writes can run in between. Databases
+    created before auto-vacuum was enabled are converted by a one-time full
+    VACUUM, which holds the write lock until it finishes.
+    Returns the number of bytes freed."""
+    pool = get_pool()
+    before = pool.write(_vacuum_state, transaction=False)
+    if before['auto_vacuum'] != 2:
+        pool.write(_convert_to_incremental_vacuum, transaction=False)
+    else:
+        remaining = before['freelist_count']
+        while remaining:
+            left = pool.write(_incremental_vacuum, step_pages, transaction=False)
+            if left >= remaining:  # Nothing more can be freed
+                break
+            remaining = left
+    after = pool.write(_vacuum_state, transaction=False)
+    return (before['page_count'] - after['page_count']) * before['page_size']
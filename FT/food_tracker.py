@@ -1,13 +1,17 @@
 import streamlit as st
 import datetime
 import pandas as pd
-import io
-import plotly.express as px
-import plotly.graph_objects as go
-import sqlite3
+import csv
 import os
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+import profiling
+from precompute import get_artifact
+from food_data import (
+    MEAL_CATEGORIES, CHART_MAX_POINTS, CHART_WEBGL_MIN_POINTS, SNAPSHOT_ENABLED, RETENTION_DAYS, USERS_DIR,
+    use_session_database, user_database, current_database, get_pool, get_range_version, get_recent_entries, get_entries_page, entry_page_key, count_entries,
+    search_entries, suggest_foods, get_stats, add_entry, update_entry, delete_entry,
+    clear_all_entries, rebuild_daily_summary, rebuild_food_catalog, rebuild_snapshot,
+    read_import_file, import_entries, archive_path, compact_entries, reclaim_space, apply_edits, undo_change, get_change_history
+)
 
 # Page configuration
 st.set_page_config(
@@ -16,572 +20,783 @@ st.set_page_config(
     layout="wide"
 )
 
-# Database setup
-def init_db():
-    """Initialize SQLite database"""
-    conn = sqlite3.connect('food_tracker.db', check_same_thread=False)
-    c = conn.cursor()
-    
-    # Create table if it doesn't exist
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS food_entries
-        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-         date TEXT NOT NULL,
-         category TEXT NOT NULL,
-         food TEXT NOT NULL,
-         beverage TEXT NOT NULL,
-         protein INTEGER DEFAULT 0,
-         notes TEXT,
-         created_at TEXT)
-    ''')
-    
-    conn.commit()
-    return conn
-
-# Initialize database
-conn = init_db()
-
-# Database functions
-def get_all_entries():
-    """Get all food entries from database"""
-    c = conn.cursor()
-    c.execute('SELECT * FROM food_entries ORDER BY date DESC, created_at DESC')
-    entries = c.fetchall()
-    
-    # Convert to list of dictionaries
-    result = []
-    for entry in entries:
-        result.append({
-            'id': entry[0],
-            'date': entry[1],
-            'category': entry[2],
-            'food': entry[3],
-            'beverage': entry[4],
-            'protein': entry[5],
-            'notes': entry[6],
-            'created_at': entry[7]
-        })
-    return result
-
-def add_entry(entry):
-    """Add a new entry to database"""
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO food_entries (date, category, food, beverage, protein, notes, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (entry['date'], entry['category'], entry['food'], entry['beverage'], 
-          entry['protein'], entry.get('notes', ''), entry['created_at']))
-    conn.commit()
-
-def update_entry(entry_id, entry):
-    """Update an existing entry"""
-    c = conn.cursor()
-    c.execute('''
-        UPDATE food_entries 
-        SET date=?, category=?, food=?, beverage=?, protein=?, notes=?
-        WHERE id=?
-    ''', (entry['date'], entry['category'], entry['food'], entry['beverage'],
-          entry['protein'], entry.get('notes', ''), entry_id))
-    conn.commit()
-
-def delete_entry(entry_id):
-    """Delete an entry from database"""
-    c = conn.cursor()
-    c.execute('DELETE FROM food_entries WHERE id=?', (entry_id,))
-    conn.commit()
-
-def clear_all_entries():
-    """Clear all entries from database"""
-    c = conn.cursor()
-    c.execute('DELETE FROM food_entries')
-    conn.commit()
-
 # Initialize session state for current page only
 if 'current_page' not in st.session_state:
     st.session_state.current_page = "Dashboard"
 
-def create_pdf_report():
-    """Create a PDF download of all food entries"""
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    # Title
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(100, height - 100, "Food Tracker Report")
-    c.setFont("Helvetica", 12)
-    c.drawString(100, height - 130, f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
-    
-    # Table headers
-    y_position = height - 170
-    headers = ["Date", "Category", "Food", "Beverage", "Protein (g)"]
-    col_positions = [50, 120, 220, 350, 450]
-    
-    c.setFont("Helvetica-Bold", 10)
-    for i, header in enumerate(headers):
-        c.drawString(col_positions[i], y_position, header)
-    
-    y_position -= 20
-    
-    # Data rows
-    entries = get_all_entries()
-    c.setFont("Helvetica", 9)
-    for entry in entries:
-        if y_position < 100:  # New page if needed
-            c.showPage()
-            y_position = height - 100
-            # Redraw headers on new page
-            c.setFont("Helvetica-Bold", 10)
-            for i, header in enumerate(headers):
-                c.drawString(col_positions[i], y_position, header)
-            y_position -= 20
-            c.setFont("Helvetica", 9)
-        
-        c.drawString(col_positions[0], y_position, entry['date'])
-        c.drawString(col_positions[1], y_position, entry['category'])
-        c.drawString(col_positions[2], y_position, entry['food'][:30])
-        c.drawString(col_positions[3], y_position, entry['beverage'][:20])
-        c.drawString(col_positions[4], y_position, str(entry.get('protein', 0)))
-        y_position -= 15
-    
-    c.save()
-    buffer.seek(0)
-    return buffer
+# Session state that belongs to one user's database
+USER_SESSION_KEYS = ['manage_filters', 'manage_cursors', 'editing_entry_id', 'csv_export_request',
+                     'pdf_export_request', 'entry_food', 'entry_protein', 'food_lookup', 'manage_search',
+                     'staged_updates', 'staged_deletes']
 
-def transform_to_daily_table():
-    """Transform data into your desired table format"""
-    entries = get_all_entries()
-    if not entries:
-        return pd.DataFrame()
-    
-    daily_data = []
-    dates = sorted(set(entry['date'] for entry in entries), reverse=True)
+# With FOOD_TRACKER_USERS_DIR set every user gets their own database file. The
+# user comes from Streamlit's login when it is configured, otherwise it is
+# entered in the sidebar and kept in the URL.
+session_user = None
+if USERS_DIR:
+    session_user = st.user.get('email') if st.user.get('is_logged_in') else None
+    if session_user:
+        st.sidebar.caption(f"👤 Signed in as {session_user}")
+    else:
+        session_user = st.sidebar.text_input("👤 User", value=st.query_params.get('user', ''), key="session_user").strip()
+    if not session_user:
+        st.title("🍕 Food Tracker")
+        st.info("Enter your user name in the sidebar to open your food log.")
+        st.stop()
+    try:
+        use_session_database(user_database(session_user))
+    except ValueError:
+        st.sidebar.error("User names may only contain letters, digits and . _ @ + -")
+        st.stop()
+    if not st.user.get('is_logged_in'):
+        st.query_params['user'] = session_user.lower()
+else:
+    use_session_database(None)
+
+if st.session_state.get('active_database') != current_database():
+    for key in USER_SESSION_KEYS:
+        st.session_state.pop(key, None)
+    st.session_state.active_database = current_database()
+
+def show_stale_notice(stale):
+    """Say so when results from before the latest change are shown"""
+    if stale:
+        st.caption("⏳ Updating in the background after the latest change, showing the previous results. "
+                   "Refresh in a moment to see the new ones.")
+
+def show_change_history():
+    """Recent changes, each with a button that undoes it"""
+    history = get_change_history()
+    if not history:
+        return
     
-    for date in dates:
-        day_entries = [entry for entry in entries if entry['date'] == date]
-        
-        day_row = {
-            'Date': date,
-            'Breakfast': '',
-            'Lunch': '',
-            'Snacks': '',
-            'Dinner': '',
-            'Beverage': '',
-            'Protein Intake': 0
-        }
-        
-        for entry in day_entries:
-            category = entry['category']
-            if category in ['Breakfast', 'Lunch', 'Snacks', 'Dinner']:
-                if day_row[category]:
-                    day_row[category] += f", {entry['food']}"
+    st.subheader("🕘 Change History")
+    for change in history:
+        label_col, undo_col = st.columns([5, 1])
+        with label_col:
+            undone = " · *undone*" if change['undone'] else ""
+            st.markdown(f"**{change['label']}** · {change['entries']} entries · "
+                        f"{change['created_at'].replace('T', ' ')}{undone}")
+        with undo_col:
+            if st.button("↩️ Undo", key=f"undo_{change['id']}", disabled=change['undone'],
+                         use_container_width=True):
+                try:
+                    undo_change(change['id'])
+                except ValueError as error:
+                    st.error(f"Can't undo: {error}")
                 else:
-                    day_row[category] = entry['food']
-            
-            if entry['beverage']:
-                if day_row['Beverage']:
-                    day_row['Beverage'] += f", {entry['beverage']}"
-                else:
-                    day_row['Beverage'] = entry['beverage']
-            
-            day_row['Protein Intake'] += entry.get('protein', 0)
-        
-        daily_data.append(day_row)
-    
-    return pd.DataFrame(daily_data)
+                    st.rerun()
 
-def create_protein_charts():
-    """Create protein intake visualization"""
-    entries = get_all_entries()
-    if not entries:
-        return None, None, None
+# Opt-in performance profiling: FOOD_TRACKER_PROFILE=1 or ?profile=1 in the URL
+profiling_enabled = profiling.ENABLED_BY_DEFAULT or st.query_params.get('profile') == '1'
+if profiling_enabled:
+    profiling.start_rerun()
+try:
+    # App title
+    st.title("🍕 Food Tracker")
+    st.markdown("Track your daily meals, beverages, and protein intake!")
     
-    df = pd.DataFrame(entries)
-    df['date'] = pd.to_datetime(df['date'])
+    # Sidebar for navigation
+    st.sidebar.title("Navigation")
     
-    daily_protein = df.groupby('date')['protein'].sum().reset_index()
-    weekly_protein = df.groupby(pd.Grouper(key='date', freq='W'))['protein'].sum().reset_index()
-    weekly_protein['week'] = weekly_protein['date'].dt.strftime('Week of %b %d')
-    category_protein = df.groupby('category')['protein'].sum().reset_index()
+    # Define pages
+    pages = {
+        "📊 Dashboard": "Dashboard",
+        "➕ Add Entry": "Add Entry", 
+        "👀 View & Edit Entries": "View & Edit Entries",
+        "📈 Protein Analytics": "Protein Analytics"
+    }
     
-    return daily_protein, weekly_protein, category_protein
-
-# App title
-st.title("🍕 Food Tracker")
-st.markdown("Track your daily meals, beverages, and protein intake!")
-
-# Sidebar for navigation
-st.sidebar.title("Navigation")
-
-# Define pages
-pages = {
-    "📊 Dashboard": "Dashboard",
-    "➕ Add Entry": "Add Entry", 
-    "👀 View & Edit Entries": "View & Edit Entries",
-    "📈 Protein Analytics": "Protein Analytics"
-}
-
-# Create navigation buttons
-for page_name, page_id in pages.items():
-    if st.sidebar.button(page_name, use_container_width=True, key=page_id):
-        st.session_state.current_page = page_id
-
-# Get current page
-current_page = st.session_state.current_page
-
-# Dashboard Page
-if current_page == "Dashboard":
-    st.header("📊 Dashboard")
+    # Create navigation buttons
+    for page_name, page_id in pages.items():
+        if st.sidebar.button(page_name, use_container_width=True, key=page_id):
+            st.session_state.current_page = page_id
     
-    entries = get_all_entries()
-    if not entries:
-        st.info("No entries yet! Add some food entries first.")
-    else:
-        # Key metrics in beautiful cards
-        st.subheader("📈 Overview")
-        col1, col2, col3, col4 = st.columns(4)
-        
-        total_entries = len(entries)
-        unique_dates = len(set(entry['date'] for entry in entries))
-        total_protein = sum(entry.get('protein', 0) for entry in entries)
-        avg_daily_protein = total_protein / unique_dates if unique_dates > 0 else 0
-        
-        with col1:
-            st.markdown(
-                f"""
-                <div style="background-color: #f0f2f6; padding: 20px; border-radius: 10px; text-align: center; border-left: 4px solid #ff4b4b;">
-                    <h3 style="margin: 0; color: #ff4b4b;">{total_entries}</h3>
-                    <p style="margin: 0; color: #666;">Total Entries</p>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-        
-        with col2:
-            st.markdown(
-                f"""
-                <div style="background-color: #f0f2f6; padding: 20px; border-radius: 10px; text-align: center; border-left: 4px solid #00d4aa;">
-                    <h3 style="margin: 0; color: #00d4aa;">{unique_dates}</h3>
-                    <p style="margin: 0; color: #666;">Days Tracked</p>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-        
-        with col3:
-            st.markdown(
-                f"""
-                <div style="background-color: #f0f2f6; padding: 20px; border-radius: 10px; text-align: center; border-left: 4px solid #ffa726;">
-                    <h3 style="margin: 0; color: #ffa726;">{total_protein:.0f}g</h3>
-                    <p style="margin: 0; color: #666;">Total Protein</p>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-        
-        with col4:
-            st.markdown(
-                f"""
-                <div style="background-color: #f0f2f6; padding: 20px; border-radius: 10px; text-align: center; border-left: 4px solid #42a5f5;">
-                    <h3 style="margin: 0; color: #42a5f5;">{avg_daily_protein:.1f}g</h3>
-                    <p style="margin: 0; color: #666;">Avg Daily Protein</p>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-        
-        # Recent entries in a proper table
-        st.subheader("📋 Recent Entries")
-        recent_entries = entries[:10]  # First 10 entries (already sorted by date DESC)
-        
-        # Create a DataFrame for the recent entries table
-        recent_df = pd.DataFrame(recent_entries)
-        recent_df['date'] = pd.to_datetime(recent_df['date']).dt.date
-        
-        # Reorder columns and format for better display
-        display_df = recent_df[['date', 'category', 'food', 'beverage', 'protein']].copy()
-        display_df = display_df.rename(columns={
-            'date': 'Date',
-            'category': 'Meal',
-            'food': 'Food',
-            'beverage': 'Beverage', 
-            'protein': 'Protein (g)'
-        })
-        
-        # Display the table with better styling
-        st.dataframe(
-            display_df,
-            use_container_width=True,
-            hide_index=True,
-            column_config={
-                "Date": st.column_config.DateColumn("Date", width="small"),
-                "Meal": st.column_config.TextColumn("Meal", width="small"),
-                "Food": st.column_config.TextColumn("Food", width="medium"),
-                "Beverage": st.column_config.TextColumn("Beverage", width="medium"),
-                "Protein (g)": st.column_config.NumberColumn("Protein (g)", width="small")
-            }
-        )
-        
-        # Quick insights
-        st.subheader("💡 Quick Insights")
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            # Most common food category
-            if recent_entries:
-                categories = [entry['category'] for entry in recent_entries]
-                most_common = max(set(categories), key=categories.count)
-                st.info(f"**Most logged meal:** {most_common}")
-            
-            # Highest protein meal
-            if recent_entries:
-                highest_protein = max(recent_entries, key=lambda x: x.get('protein', 0))
-                st.info(f"**Highest protein meal:** {highest_protein['food']} ({highest_protein.get('protein', 0)}g)")
-        
-        with col2:
-            # Recent activity
-            today = datetime.date.today()
-            today_entries = [entry for entry in entries 
-                           if datetime.datetime.strptime(entry['date'], '%Y-%m-%d').date() == today]
-            st.info(f"**Today's entries:** {len(today_entries)}")
-            
-            # Weekly summary
-            week_ago = today - datetime.timedelta(days=7)
-            recent_week_entries = [entry for entry in entries 
-                                 if datetime.datetime.strptime(entry['date'], '%Y-%m-%d').date() >= week_ago]
-            st.info(f"**Last 7 days:** {len(recent_week_entries)} entries")
-
-# Add Entry Page
-elif current_page == "Add Entry":
-    st.header("Add New Food Entry")
+    # Global filters, applied as SQL predicates inside the data functions
+    st.sidebar.markdown("---")
+    st.sidebar.header("Filters")
+    periods = {"All time": None, "Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "Last year": 365}
+    period = st.sidebar.selectbox("Period", list(periods) + ["Custom range"], key="filter_period")
+    range_start = range_end = None
+    if period == "Custom range":
+        custom_range = st.sidebar.date_input("Dates", value=[], key="filter_range")
+        range_start = custom_range[0] if len(custom_range) > 0 else None
+        range_end = custom_range[1] if len(custom_range) > 1 else range_start
+    elif periods[period]:
+        range_start = datetime.date.today() - datetime.timedelta(days=periods[period] - 1)
+    range_categories = tuple(st.sidebar.multiselect("Meal categories", MEAL_CATEGORIES, key="filter_categories"))
+    data_filters = {'start_date': range_start, 'end_date': range_end, 'categories': range_categories}
+    filters_active = bool(range_start or range_end or range_categories)
+    no_entries_message = ("No entries match the sidebar filters." if filters_active
+                          else "No entries yet! Add some food entries first.")
     
-    with st.container():
-        with st.form("food_form", clear_on_submit=True):
-            col1, col2 = st.columns(2)
+    # Get current page
+    current_page = st.session_state.current_page
+    if profiling_enabled:
+        profiling.current().label = current_page
+    page_span = profiling.begin(f"page {current_page}", 'page')
+    
+    # Dashboard Page
+    if current_page == "Dashboard":
+        st.header("📊 Dashboard")
+        
+        stats = get_stats(**data_filters)
+        if not stats['total_entries']:
+            st.info(no_entries_message)
+        else:
+            # Key metrics in beautiful cards
+            st.subheader("📈 Overview")
+            col1, col2, col3, col4 = st.columns(4)
+            
+            total_entries = stats['total_entries']
+            unique_dates = stats['unique_dates']
+            total_protein = stats['total_protein']
+            avg_daily_protein = stats['avg_daily_protein']
             
             with col1:
-                date = st.date_input("Date", datetime.date.today())
-                category = st.selectbox("Meal Category", ["Breakfast", "Lunch", "Snacks", "Dinner"])
-                protein = st.number_input("Protein Intake (grams)", min_value=0, value=0, step=5)
+                st.markdown(
+                    f"""
+                    <div style="background-color: #f0f2f6; padding: 20px; border-radius: 10px; text-align: center; border-left: 4px solid #ff4b4b;">
+                        <h3 style="margin: 0; color: #ff4b4b;">{total_entries}</h3>
+                        <p style="margin: 0; color: #666;">Total Entries</p>
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
             
             with col2:
-                food = st.text_input("What did you eat?", placeholder="e.g., Grilled chicken with rice")
-                beverage = st.text_input("What did you drink?", placeholder="e.g., Water, Protein shake")
-                notes = st.text_area("Additional Notes (optional)", placeholder="Any extra details about your meal...")
+                st.markdown(
+                    f"""
+                    <div style="background-color: #f0f2f6; padding: 20px; border-radius: 10px; text-align: center; border-left: 4px solid #00d4aa;">
+                        <h3 style="margin: 0; color: #00d4aa;">{unique_dates}</h3>
+                        <p style="margin: 0; color: #666;">Days Tracked</p>
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
             
-            col1, col2, col3 = st.columns([1, 2, 1])
-            with col2:
-                submitted = st.form_submit_button("🍽️ Add Food Entry", use_container_width=True)
-            
-            if submitted:
-                if food:
-                    new_entry = {
-                        "date": date.isoformat(),
-                        "category": category,
-                        "food": food,
-                        "beverage": beverage,
-                        "protein": protein,
-                        "notes": notes,
-                        "created_at": datetime.datetime.now().isoformat()
-                    }
-                    
-                    add_entry(new_entry)
-                    st.success("✅ Entry added successfully!")
-                    st.balloons()
-                else:
-                    st.error("Please fill in at least the food field!")
-
-# View & Edit Entries Page
-elif current_page == "View & Edit Entries":
-    st.header("View & Manage Entries")
-    
-    entries = get_all_entries()
-    if not entries:
-        st.info("No entries yet! Add some food entries first.")
-    else:
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            df = transform_to_daily_table()
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="📥 Download CSV",
-                data=csv,
-                file_name=f"food_tracker_{datetime.date.today()}.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
-        
-        with col2:
-            pdf_buffer = create_pdf_report()
-            st.download_button(
-                label="📥 Download PDF Report",
-                data=pdf_buffer,
-                file_name=f"food_tracker_report_{datetime.date.today()}.pdf",
-                mime="application/pdf",
-                use_container_width=True
-            )
-        
-        with col3:
-            if st.button("🔄 Refresh Data", use_container_width=True):
-                st.rerun()
-        
-        st.markdown("---")
-        st.subheader("Daily Summary Table")
-        daily_df = transform_to_daily_table()
-        
-        if not daily_df.empty:
+            with col3:
+                st.markdown(
+                    f"""
+                    <div style="background-color: #f0f2f6; padding: 20px; border-radius: 10px; text-align: center; border-left: 4px solid #ffa726;">
+                        <h3 style="margin: 0; color: #ffa726;">{total_protein:.0f}g</h3>
+                        <p style="margin: 0; color: #666;">Total Protein</p>
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
+            
+            with col4:
+                st.markdown(
+                    f"""
+                    <div style="background-color: #f0f2f6; padding: 20px; border-radius: 10px; text-align: center; border-left: 4px solid #42a5f5;">
+                        <h3 style="margin: 0; color: #42a5f5;">{avg_daily_protein:.1f}g</h3>
+                        <p style="margin: 0; color: #666;">Avg Daily Protein</p>
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
+            
+            # Recent entries in a proper table
+            st.subheader("📋 Recent Entries")
+            recent_entries = get_recent_entries(10, **data_filters)  # Already sorted by date DESC
+            
+            # Create a DataFrame for the recent entries table
+            recent_df = pd.DataFrame(recent_entries)
+            recent_df['date'] = pd.to_datetime(recent_df['date']).dt.date
+            
+            # Reorder columns and format for better display
+            display_df = recent_df[['date', 'category', 'food', 'beverage', 'protein']].copy()
+            display_df = display_df.rename(columns={
+                'date': 'Date',
+                'category': 'Meal',
+                'food': 'Food',
+                'beverage': 'Beverage', 
+                'protein': 'Protein (g)'
+            })
+            
+            # Display the table with better styling
             st.dataframe(
-                daily_df,
+                display_df,
                 use_container_width=True,
                 hide_index=True,
                 column_config={
-                    "Date": st.column_config.DateColumn("Date", width="large"),
-                    "Breakfast": st.column_config.TextColumn("Breakfast", width="large"),
-                    "Lunch": st.column_config.TextColumn("Lunch", width="large"),
-                    "Snacks": st.column_config.TextColumn("Snacks", width="large"),
-                    "Dinner": st.column_config.TextColumn("Dinner", width="large"),
+                    "Date": st.column_config.DateColumn("Date", width="small"),
+                    "Meal": st.column_config.TextColumn("Meal", width="small"),
+                    "Food": st.column_config.TextColumn("Food", width="medium"),
                     "Beverage": st.column_config.TextColumn("Beverage", width="medium"),
-                    "Protein Intake": st.column_config.NumberColumn("Protein (g)", format="%d g")
+                    "Protein (g)": st.column_config.NumberColumn("Protein (g)", width="small")
                 }
             )
-        
-        st.markdown("---")
-        st.subheader("Manage Individual Entries")
-        
-        for entry in entries:
-            with st.expander(f"{entry['date']} - {entry['category']}: {entry['food']}", expanded=False):
-                col1, col2 = st.columns([3, 1])
+            
+            # Quick insights
+            st.subheader("💡 Quick Insights")
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                # Most common food category
+                if recent_entries:
+                    categories = [entry['category'] for entry in recent_entries]
+                    most_common = max(set(categories), key=categories.count)
+                    st.info(f"**Most logged meal:** {most_common}")
+                
+                # Highest protein meal
+                if recent_entries:
+                    highest_protein = max(recent_entries, key=lambda x: x.get('protein', 0))
+                    st.info(f"**Highest protein meal:** {highest_protein['food']} ({highest_protein.get('protein', 0)}g)")
+            
+            with col2:
+                # Recent activity
+                st.info(f"**Today's entries:** {stats['today_entries']}")
+                
+                # Weekly summary
+                st.info(f"**Last 7 days:** {stats['week_entries']} entries")
+    
+    # Add Entry Page
+    elif current_page == "Add Entry":
+        st.header("Add New Food Entry")
+        
+        # Food lookup sits outside the form so suggestions update as you type
+        def use_suggestion(suggestion):
+            st.session_state.entry_food = suggestion['food']
+            st.session_state.entry_protein = suggestion['median_protein']
+            st.session_state.food_lookup = ""
+        
+        food_lookup = st.text_input("🔎 Find a food you've logged before", key="food_lookup",
+                                    placeholder="Start typing, e.g. chick")
+        if food_lookup.strip():
+            suggestions = suggest_foods(food_lookup, limit=6)
+            if not suggestions:
+                st.caption("No logged foods match. Type it in the form below.")
+            suggestion_cols = st.columns(3)
+            for number, suggestion in enumerate(suggestions):
+                with suggestion_cols[number % 3]:
+                    st.button(f"{suggestion['food']} · {suggestion['median_protein']} g",
+                              key=f"suggestion_{number}", on_click=use_suggestion, args=(suggestion,),
+                              help=f"Logged {suggestion['uses']} times, last on {suggestion['last_used']}",
+                              use_container_width=True)
+        
+        with st.container():
+            with st.form("food_form", clear_on_submit=True):
+                col1, col2 = st.columns(2)
                 
                 with col1:
-                    with st.form(f"edit_form_{entry['id']}"):
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            edit_date = st.date_input("Date", datetime.datetime.strptime(entry['date'], '%Y-%m-%d').date(), key=f"date_{entry['id']}")
-                            edit_category = st.selectbox("Category", ["Breakfast", "Lunch", "Snacks", "Dinner"], index=["Breakfast", "Lunch", "Snacks", "Dinner"].index(entry['category']), key=f"cat_{entry['id']}")
-                            edit_protein = st.number_input("Protein (g)", value=entry.get('protein', 0), key=f"prot_{entry['id']}")
-                        
-                        with col2:
-                            edit_food = st.text_input("Food", value=entry['food'], key=f"food_{entry['id']}")
-                            edit_beverage = st.text_input("Beverage", value=entry['beverage'], key=f"bev_{entry['id']}")
-                            edit_notes = st.text_area("Notes", value=entry.get('notes', ''), key=f"notes_{entry['id']}")
+                    date = st.date_input("Date", datetime.date.today())
+                    category = st.selectbox("Meal Category", ["Breakfast", "Lunch", "Snacks", "Dinner"])
+                    protein = st.number_input("Protein Intake (grams)", min_value=0, step=5, key="entry_protein")
+                
+                with col2:
+                    food = st.text_input("What did you eat?", placeholder="e.g., Grilled chicken with rice",
+                                         key="entry_food")
+                    beverage = st.text_input("What did you drink?", placeholder="e.g., Water, Protein shake")
+                    notes = st.text_area("Additional Notes (optional)", placeholder="Any extra details about your meal...")
+                
+                col1, col2, col3 = st.columns([1, 2, 1])
+                with col2:
+                    submitted = st.form_submit_button("🍽️ Add Food Entry", use_container_width=True)
+                
+                if submitted:
+                    if food:
+                        new_entry = {
+                            "date": date.isoformat(),
+                            "category": category,
+                            "food": food,
+                            "beverage": beverage,
+                            "protein": protein,
+                            "notes": notes,
+                            "created_at": datetime.datetime.now().isoformat()
+                        }
                         
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            if st.form_submit_button("💾 Update Entry", use_container_width=True):
-                                updated_entry = {
-                                    "date": edit_date.isoformat(),
-                                    "category": edit_category,
-                                    "food": edit_food,
-                                    "beverage": edit_beverage,
-                                    "protein": edit_protein,
-                                    "notes": edit_notes,
-                                    "created_at": entry.get('created_at', datetime.datetime.now().isoformat())
-                                }
+                        add_entry(new_entry)
+                        st.success("✅ Entry added successfully!")
+                        st.balloons()
+                    else:
+                        st.error("Please fill in at least the food field!")
+        
+        st.markdown("---")
+        with st.expander("📤 Bulk Import"):
+            st.write("Import a legacy `food_log.json` log, a CSV of entries "
+                     "(date, category, food, beverage, protein, notes, created_at) "
+                     "or a daily table CSV downloaded from this app. "
+                     "Entries that already exist are skipped.")
+            
+            uploaded_file = st.file_uploader("Choose a file", type=["json", "csv"])
+            import_source = None
+            if uploaded_file is not None:
+                if st.button("📤 Import File", use_container_width=True):
+                    import_source = (uploaded_file.name, uploaded_file.getvalue())
+            elif os.path.exists('food_log.json'):
+                if st.button("📤 Import food_log.json", use_container_width=True):
+                    with open('food_log.json', 'rb') as legacy_file:
+                        import_source = ('food_log.json', legacy_file.read())
+            
+            if import_source:
+                progress_bar = st.progress(0.0, text="Reading file...")
+                try:
+                    records = read_import_file(*import_source)
+                except (ValueError, UnicodeDecodeError, csv.Error) as error:
+                    st.error(f"Could not read {import_source[0]}: {error}")
+                else:
+                    result = import_entries(records, progress=lambda fraction, text: progress_bar.progress(fraction, text=text))
+                    st.success(f"✅ Imported {result['imported']} entries "
+                               f"({result['duplicates']} duplicates skipped)")
+                    if result['invalid']:
+                        st.warning(f"{result['invalid']} records were invalid and skipped")
+                        st.text("\n".join(result['errors'][:20]))
+    
+    # View & Edit Entries Page
+    elif current_page == "View & Edit Entries":
+        st.header("View & Manage Entries")
+        
+        stats = get_stats()
+        if not stats['total_entries']:
+            st.info("No entries yet! Add some food entries first.")
+            show_change_history()
+        else:
+            col1, col2, col3 = st.columns(3)
+            
+            # Exports are generated only when asked for, and have to be prepared
+            # again after a change to their date range
+            export_filters = (range_start, range_end, range_categories)
+            export_request = (current_database(), get_range_version(range_start, range_end), *export_filters)
+            if filters_active:
+                st.caption("Exports and the daily summary follow the sidebar filters.")
+            
+            with col1:
+                if st.session_state.get('csv_export_request') != export_request:
+                    if st.button("📄 Prepare CSV", use_container_width=True):
+                        st.session_state.csv_export_request = export_request
+                        st.rerun()
+                else:
+                    with st.spinner("Preparing CSV..."):
+                        csv_data, _ = get_artifact('csv', *export_filters)
+                    st.download_button(
+                        label="📥 Download CSV",
+                        data=csv_data,
+                        file_name=f"food_tracker_{datetime.date.today()}.csv",
+                        mime="text/csv",
+                        use_container_width=True
+                    )
+            
+            with col2:
+                if st.session_state.get('pdf_export_request') != export_request:
+                    if st.button("📄 Prepare PDF Report", use_container_width=True):
+                        st.session_state.pdf_export_request = export_request
+                        st.rerun()
+                else:
+                    with st.spinner("Preparing PDF report..."):
+                        pdf_data, _ = get_artifact('pdf', *export_filters)
+                    st.download_button(
+                        label="📥 Download PDF Report",
+                        data=pdf_data,
+                        file_name=f"food_tracker_report_{datetime.date.today()}.pdf",
+                        mime="application/pdf",
+                        use_container_width=True
+                    )
+            
+            with col3:
+                if st.button("🔄 Refresh Data", use_container_width=True):
+                    st.rerun()
+            
+            st.markdown("---")
+            st.subheader("Daily Summary Table")
+            daily_df, daily_stale = get_artifact('daily_table', range_start, range_end, range_categories)
+            show_stale_notice(daily_stale)
+            
+            if not daily_df.empty:
+                st.dataframe(
+                    daily_df,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "Date": st.column_config.DateColumn("Date", width="large"),
+                        "Breakfast": st.column_config.TextColumn("Breakfast", width="large"),
+                        "Lunch": st.column_config.TextColumn("Lunch", width="large"),
+                        "Snacks": st.column_config.TextColumn("Snacks", width="large"),
+                        "Dinner": st.column_config.TextColumn("Dinner", width="large"),
+                        "Beverage": st.column_config.TextColumn("Beverage", width="medium"),
+                        "Protein Intake": st.column_config.NumberColumn("Protein (g)", format="%d g")
+                    }
+                )
+            else:
+                st.info(no_entries_message)
+            
+            st.markdown("---")
+            st.subheader("Manage Individual Entries")
+            
+            search_text = st.text_input("🔍 Search foods, beverages and notes", key="manage_search",
+                                        placeholder="e.g. chicken, protein shake, post workout")
+            
+            # Filters for the paged entry list
+            filter_col1, filter_col2, filter_col3 = st.columns([1, 1, 2])
+            with filter_col1:
+                filter_start = st.date_input("From", value=None, key="manage_from")
+            with filter_col2:
+                filter_end = st.date_input("To", value=None, key="manage_to")
+            with filter_col3:
+                filter_categories = st.multiselect("Categories", MEAL_CATEGORIES, key="manage_categories")
+            
+            # Keyset pagination state: the page key each visited page starts after.
+            # Changing a filter starts over from the first page.
+            filters = (search_text, filter_start, filter_end, tuple(filter_categories))
+            if st.session_state.get('manage_filters') != filters:
+                st.session_state.manage_filters = filters
+                st.session_state.manage_cursors = [None]
+                st.session_state.editing_entry_id = None
+            
+            # Edit session: updates and deletes are staged here and applied together
+            # in one transaction, so nothing is reloaded until they are applied
+            edit_session = st.toggle("✍️ Edit session: stage changes and apply them together", key="edit_session")
+            staged_updates = st.session_state.setdefault('staged_updates', {})
+            staged_deletes = st.session_state.setdefault('staged_deletes', set())
+            if staged_updates or staged_deletes:
+                staged_count = len(set(staged_updates) | staged_deletes)
+                st.info(f"{staged_count} staged changes: {len(staged_updates)} edits, {len(staged_deletes)} deletes")
+                apply_col, discard_col = st.columns(2)
+                with apply_col:
+                    if st.button(f"✅ Apply {staged_count} Changes", type="primary", use_container_width=True):
+                        apply_edits(staged_updates, staged_deletes)
+                        staged_updates.clear()
+                        staged_deletes.clear()
+                        st.session_state.editing_entry_id = None
+                        st.rerun()
+                with discard_col:
+                    if st.button("✖️ Discard Staged Changes", use_container_width=True):
+                        staged_updates.clear()
+                        staged_deletes.clear()
+                        st.rerun()
+            
+            page_size = 25
+            page_number = len(st.session_state.manage_cursors)
+            if search_text.strip():
+                # Search shows the best matches on a single page
+                page_entries = search_entries(search_text, limit=page_size, start_date=filter_start,
+                                              end_date=filter_end, categories=filter_categories)
+                has_next = False
+                st.caption(f"{len(page_entries)} best matches for \"{search_text.strip()}\"")
+            else:
+                page_entries = get_entries_page(
+                    after=st.session_state.manage_cursors[-1], limit=page_size + 1,
+                    start_date=filter_start, end_date=filter_end, categories=filter_categories
+                )
+                has_next = len(page_entries) > page_size
+                page_entries = page_entries[:page_size]
+                
+                matching = count_entries(filter_start, filter_end, filter_categories)
+                st.caption(f"Page {page_number} · {matching} matching entries")
+            
+            if not page_entries:
+                st.info("No entries match these filters.")
+            
+            for entry in page_entries:
+                staged_delete = entry['id'] in staged_deletes
+                staged_edit = entry['id'] in staged_updates
+                entry = {**entry, **staged_updates.get(entry['id'], {})}
+                row_col1, row_col2 = st.columns([5, 1])
+                with row_col1:
+                    row_text = f"**{entry['date']}** - {entry['category']}: {entry['food']}"
+                    if staged_delete:
+                        st.markdown(f"~~{row_text}~~ · 🗑️ *delete staged*")
+                    elif staged_edit:
+                        st.markdown(f"{row_text} · ✏️ *edit staged*")
+                    else:
+                        st.markdown(row_text)
+                with row_col2:
+                    is_open = st.session_state.get('editing_entry_id') == entry['id']
+                    if st.button("✖️ Close" if is_open else "✏️ Edit", key=f"toggle_{entry['id']}",
+                                 use_container_width=True):
+                        st.session_state.editing_entry_id = None if is_open else entry['id']
+                        st.rerun()
+                
+                # Only the opened row gets an edit form
+                if st.session_state.get('editing_entry_id') != entry['id']:
+                    continue
+                
+                with st.form(f"edit_form_{entry['id']}"):
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        edit_date = st.date_input("Date", datetime.datetime.strptime(entry['date'], '%Y-%m-%d').date(), key=f"date_{entry['id']}")
+                        edit_category = st.selectbox("Category", ["Breakfast", "Lunch", "Snacks", "Dinner"], index=["Breakfast", "Lunch", "Snacks", "Dinner"].index(entry['category']), key=f"cat_{entry['id']}")
+                        edit_protein = st.number_input("Protein (g)", value=entry.get('protein', 0), key=f"prot_{entry['id']}")
+                    
+                    with col2:
+                        edit_food = st.text_input("Food", value=entry['food'], key=f"food_{entry['id']}")
+                        edit_beverage = st.text_input("Beverage", value=entry['beverage'], key=f"bev_{entry['id']}")
+                        edit_notes = st.text_area("Notes", value=entry.get('notes', ''), key=f"notes_{entry['id']}")
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        if st.form_submit_button("💾 Update Entry", use_container_width=True):
+                            updated_entry = {
+                                "date": edit_date.isoformat(),
+                                "category": edit_category,
+                                "food": edit_food,
+                                "beverage": edit_beverage,
+                                "protein": edit_protein,
+                                "notes": edit_notes,
+                                "created_at": entry.get('created_at', datetime.datetime.now().isoformat())
+                            }
+                            if edit_session:
+                                staged_updates[entry['id']] = updated_entry
+                                staged_deletes.discard(entry['id'])
+                            else:
                                 update_entry(entry['id'], updated_entry)
                                 st.success("Entry updated successfully!")
-                                st.rerun()
-                        
-                        with col2:
-                            if st.form_submit_button("🗑️ Delete Entry", use_container_width=True):
+                            st.session_state.editing_entry_id = None
+                            st.rerun()
+                    
+                    with col2:
+                        if st.form_submit_button("🗑️ Delete Entry", use_container_width=True):
+                            if edit_session:
+                                staged_deletes.add(entry['id'])
+                                staged_updates.pop(entry['id'], None)
+                            else:
                                 delete_entry(entry['id'])
                                 st.success(f"Deleted entry: {entry['food']}")
-                                st.rerun()
-        
-        st.markdown("---")
-        st.subheader("🚨 Danger Zone")
-        
-        with st.expander("Clear All Entries"):
-            st.warning("This will permanently delete ALL your food entries. This action cannot be undone!")
-            st.write(f"**Total entries that will be deleted:** {len(entries)}")
-            
-            if st.button("🗑️ Yes, Clear All Entries", type="primary", use_container_width=True):
-                clear_all_entries()
-                st.success("All entries cleared successfully!")
-                st.rerun()
-
-# Protein Analytics Page
-elif current_page == "Protein Analytics":
-    st.header("📈 Protein Intake Analytics")
+                            st.session_state.editing_entry_id = None
+                            st.rerun()
+            
+            # Page navigation
+            nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+            with nav_col1:
+                if st.button("⬅️ Previous", disabled=page_number == 1, use_container_width=True):
+                    st.session_state.manage_cursors.pop()
+                    st.session_state.editing_entry_id = None
+                    st.rerun()
+            with nav_col3:
+                if st.button("Next ➡️", disabled=not has_next, use_container_width=True):
+                    st.session_state.manage_cursors.append(entry_page_key(page_entries[-1]))
+                    st.session_state.editing_entry_id = None
+                    st.rerun()
+            
+            st.markdown("---")
+            show_change_history()
+            
+            st.markdown("---")
+            st.subheader("🛠️ Maintenance")
+            
+            with st.expander("Rebuild Summary Tables"):
+                st.write("Recompute the daily summary, food catalog and analytics snapshot from every logged entry. "
+                         "Use this after editing the database outside the app.")
+                
+                if st.button("🔁 Rebuild Summary Tables", use_container_width=True):
+                    get_pool().write(rebuild_daily_summary)
+                    get_pool().write(rebuild_food_catalog)
+                    if SNAPSHOT_ENABLED:
+                        rebuild_snapshot()
+                    st.success("Summary tables rebuilt!")
+                    st.rerun()
+            
+            with st.expander("Compact Old Entries"):
+                st.write("Roll up entries older than the retention period into one row per day and meal, "
+                         "dropping their notes. Daily tables, charts and protein totals stay the same, "
+                         "but entry counts shrink to the rolled-up rows.")
+                
+                retention_days = st.number_input("Keep individual entries for (days)", min_value=30,
+                                                 value=RETENTION_DAYS, step=30)
+                cutoff = datetime.date.today() - datetime.timedelta(days=int(retention_days))
+                keep_archive = st.checkbox(f"Move the original entries to {os.path.basename(archive_path())}", value=True)
+                
+                if st.button(f"🗜️ Compact Entries Before {cutoff}", use_container_width=True):
+                    progress_bar = st.progress(0.0, text="Finding days to compact...")
+                    result = compact_entries(cutoff, archive=keep_archive,
+                                             progress=lambda fraction, text: progress_bar.progress(fraction, text=text))
+                    freed = reclaim_space()
+                    st.success(f"✅ Compacted {result['days']} days: {result['removed']} entries became "
+                               f"{result['written']} rows, {freed / 1024 / 1024:.1f} MB freed")
+            
+            st.markdown("---")
+            st.subheader("🚨 Danger Zone")
+            
+            with st.expander("Clear All Entries"):
+                st.warning("This will delete ALL your food entries. They can be restored from the Change History.")
+                st.write(f"**Total entries that will be deleted:** {stats['total_entries']}")
+                
+                if st.button("🗑️ Yes, Clear All Entries", type="primary", use_container_width=True):
+                    clear_all_entries()
+                    st.success("All entries cleared successfully!")
+                    st.rerun()
+    
+    # Protein Analytics Page
+    elif current_page == "Protein Analytics":
+        st.header("📈 Protein Intake Analytics")
+        
+        stats = get_stats(**data_filters)
+        if not stats['total_entries']:
+            st.info(no_entries_message)
+        else:
+            import plotly.express as px  # Loaded on first use, only this page draws charts
+            
+            col1, col2, col3 = st.columns(3)
+            total_protein = stats['total_protein']
+            unique_dates = stats['unique_dates']
+            avg_daily = stats['avg_daily_protein']
+            
+            with col1:
+                st.metric("Total Protein", f"{total_protein:.0f} g")
+            with col2:
+                st.metric("Average Daily", f"{avg_daily:.1f} g")
+            with col3:
+                st.metric("Days Tracked", unique_dates)
+            
+            resolution = st.radio("Resolution", ["Auto", "Day", "Week", "Month"],
+                                  horizontal=True, key="chart_resolution")
+            charts, charts_stale = get_artifact('charts', range_start, range_end, range_categories, resolution.lower())
+            trend, period_totals, category_protein, trend_resolution = charts
+            show_stale_notice(charts_stale)
+            
+            if trend is not None:
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.subheader("Daily Protein Intake")
+                    if len(trend) > 1:
+                        with profiling.span("daily trend chart", 'chart'):
+                            title = "Daily Protein Trend" if trend_resolution == 'day' else \
+                                f"Average Daily Protein per {trend_resolution.title()}"
+                            fig_daily = px.line(trend, x='date', y='protein', 
+                                              labels={'protein': 'Protein (g)', 'date': 'Date'},
+                                              title=title,
+                                              render_mode='webgl' if len(trend) >= CHART_WEBGL_MIN_POINTS else 'svg')
+                            fig_daily.update_traces(line=dict(color='#FF4B4B', width=3))
+                            st.plotly_chart(fig_daily, use_container_width=True)
+                    else:
+                        st.info("Need more data points for daily trend")
+                
+                with col2:
+                    st.subheader("Protein by Meal Category")
+                    if not category_protein.empty:
+                        with profiling.span("category chart", 'chart'):
+                            fig_category = px.pie(category_protein, values='protein', names='category',
+                                                title="Protein Distribution by Meal",
+                                                color_discrete_sequence=px.colors.sequential.Redor_r)
+                            st.plotly_chart(fig_category, use_container_width=True)
+                
+                weekly = 'week' in period_totals
+                st.subheader("Weekly Protein Intake" if weekly else "Monthly Protein Intake")
+                if len(period_totals) > 1:
+                    with profiling.span("period chart", 'chart'):
+                        fig_weekly = px.bar(period_totals, x='date', y='protein', hover_name='week' if weekly else 'month',
+                                          labels={'protein': 'Protein (g)', 'date': 'Week' if weekly else 'Month'},
+                                          title="Weekly Protein Summary" if weekly else "Monthly Protein Summary")
+                        fig_weekly.update_traces(marker_color='#FF6B6B')
+                        st.plotly_chart(fig_weekly, use_container_width=True)
+            
+            st.subheader("🏋️ Protein Goals")
+            goal_col1, goal_col2 = st.columns(2)
+            
+            with goal_col1:
+                protein_goal = st.number_input("Set your daily protein goal (grams)", 
+                                             min_value=0, value=130, step=5)
+            
+            with goal_col2:
+                if stats['latest_date'] and protein_goal:
+                    latest_protein = stats['latest_protein']
+                    goal_percentage = (latest_protein / protein_goal) * 100
+                    st.metric("Latest Day vs Goal", f"{goal_percentage:.1f}%", 
+                             delta=f"{latest_protein - protein_goal:.0f} g")
+            
+            analytics, analytics_stale = get_artifact('goal_analytics', protein_goal, range_start, range_end,
+                                                      range_categories)
+            show_stale_notice(analytics_stale)
+            if analytics is not None:
+                col1, col2, col3, col4, col5 = st.columns(5)
+                with col1:
+                    st.metric("7-Day Average", f"{analytics['avg_7d']:.1f} g")
+                with col2:
+                    st.metric("30-Day Average", f"{analytics['avg_30d']:.1f} g")
+                with col3:
+                    st.metric("Current Streak", f"{analytics['current_streak']} days")
+                with col4:
+                    st.metric("Longest Streak", f"{analytics['longest_streak']} days")
+                with col5:
+                    st.metric("Days on Goal", f"{analytics['adherence_pct']:.1f}%")
+                
+                goal_trend = analytics['trend']
+                category_trends = analytics['category_trends']
+                # Moving averages are smooth, so evenly spaced days keep the payload bounded
+                step = -(-len(goal_trend) // CHART_MAX_POINTS) or 1
+                goal_trend = goal_trend.iloc[::step]
+                category_trends = category_trends.iloc[::step]
+                render_mode = 'webgl' if len(goal_trend) >= CHART_WEBGL_MIN_POINTS else 'svg'
+                
+                if len(goal_trend) > 1:
+                    with profiling.span("moving average chart", 'chart'):
+                        fig_average = px.line(goal_trend, x='date', y=['avg_7d', 'avg_30d'],
+                                              labels={'value': 'Protein (g)', 'date': 'Date', 'variable': ''},
+                                              title="7- and 30-Day Moving Averages", render_mode=render_mode)
+                        fig_average.add_hline(y=protein_goal, line_dash='dash', line_color='#4CAF50',
+                                              annotation_text="Goal")
+                        st.plotly_chart(fig_average, use_container_width=True)
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        adherence = analytics['monthly_adherence' if trend_resolution == 'month' else 'weekly_adherence']
+                        with profiling.span("adherence chart", 'chart'):
+                            fig_adherence = px.bar(adherence, x='date', y='adherence_pct',
+                                                   hover_data=['days_hit', 'days'],
+                                                   labels={'adherence_pct': 'Days on goal (%)', 'date': ''},
+                                                   title="Goal Adherence per " + (
+                                                       "Month" if trend_resolution == 'month' else "Week"))
+                            fig_adherence.update_traces(marker_color='#4CAF50')
+                            st.plotly_chart(fig_adherence, use_container_width=True)
+                    with col2:
+                        with profiling.span("category trend chart", 'chart'):
+                            fig_categories = px.line(category_trends, x='date',
+                                                     y=[column for column in category_trends.columns if column != 'date'],
+                                                     labels={'value': 'Protein (g)', 'date': '', 'variable': 'Category'},
+                                                     title="30-Day Average by Meal Category", render_mode=render_mode)
+                            st.plotly_chart(fig_categories, use_container_width=True)
+    
+    profiling.end(page_span)
     
-    entries = get_all_entries()
-    if not entries:
-        st.info("No entries yet! Add some food entries first.")
+    # Enhanced Statistics in sidebar
+    st.sidebar.markdown("---")
+    st.sidebar.header("Statistics")
+    stats = get_stats(**data_filters)
+    if stats['total_entries']:
+        st.sidebar.metric("Total Entries", stats['total_entries'])
+        st.sidebar.metric("Days Tracked", stats['unique_dates'])
+        st.sidebar.metric("Total Protein", f"{stats['total_protein']:.0f} g")
+        st.sidebar.metric("Avg Daily Protein", f"{stats['avg_daily_protein']:.1f} g")
+    elif filters_active:
+        st.sidebar.info("No entries match the filters.")
     else:
-        daily_protein, weekly_protein, category_protein = create_protein_charts()
-        
-        col1, col2, col3 = st.columns(3)
-        total_protein = sum(entry.get('protein', 0) for entry in entries)
-        unique_dates = len(set(entry['date'] for entry in entries))
-        avg_daily = total_protein / unique_dates if unique_dates > 0 else 0
-        
-        with col1:
-            st.metric("Total Protein", f"{total_protein:.0f} g")
-        with col2:
-            st.metric("Average Daily", f"{avg_daily:.1f} g")
-        with col3:
-            st.metric("Days Tracked", unique_dates)
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.subheader("Daily Protein Intake")
-            if len(daily_protein) > 1:
-                fig_daily = px.line(daily_protein, x='date', y='protein', 
-                                  labels={'protein': 'Protein (g)', 'date': 'Date'},
-                                  title="Daily Protein Trend")
-                fig_daily.update_traces(line=dict(color='#FF4B4B', width=3))
-                st.plotly_chart(fig_daily, use_container_width=True)
-            else:
-                st.info("Need more data points for daily trend")
-        
-        with col2:
-            st.subheader("Protein by Meal Category")
-            if not category_protein.empty:
-                fig_category = px.pie(category_protein, values='protein', names='category',
-                                    title="Protein Distribution by Meal",
-                                    color_discrete_sequence=px.colors.sequential.Redor_r)
-                st.plotly_chart(fig_category, use_container_width=True)
-        
-        st.subheader("Weekly Protein Intake")
-        if len(weekly_protein) > 1:
-            fig_weekly = px.bar(weekly_protein, x='week', y='protein',
-                              labels={'protein': 'Protein (g)', 'week': 'Week'},
-                              title="Weekly Protein Summary")
-            fig_weekly.update_traces(marker_color='#FF6B6B')
-            st.plotly_chart(fig_weekly, use_container_width=True)
-        
-        st.subheader("🏋️ Protein Goals")
-        goal_col1, goal_col2 = st.columns(2)
-        
-        with goal_col1:
-            protein_goal = st.number_input("Set your daily protein goal (grams)", 
-                                         min_value=0, value=130, step=5)
-        
-        with goal_col2:
-            if daily_protein is not None and not daily_protein.empty:
-                latest_protein = daily_protein['protein'].iloc[-1]
-                goal_percentage = (latest_protein / protein_goal) * 100
-                st.metric("Latest Day vs Goal", f"{goal_percentage:.1f}%", 
-                         delta=f"{latest_protein - protein_goal:.0f} g")
+        st.sidebar.info("Add entries to see stats!")
+finally:
+    # Also runs when the page stops early (st.stop, st.rerun or an error), or
+    # process-wide memory tracing would stay on for every session
+    rerun_profile = profiling.finish_rerun() if profiling_enabled else None
 
-# Enhanced Statistics in sidebar
-st.sidebar.markdown("---")
-st.sidebar.header("Statistics")
-entries = get_all_entries()
-if entries:
-    total_entries = len(entries)
-    unique_dates = len(set(entry['date'] for entry in entries))
-    total_protein = sum(entry.get('protein', 0) for entry in entries)
-    avg_daily_protein = total_protein / unique_dates if unique_dates > 0 else 0
+# Performance debug panel
+if rerun_profile:
+    profile_history = st.session_state.setdefault('profile_history', [])
+    profile_history.append(rerun_profile)
+    del profile_history[:-50]  # Keep the last 50 reruns
     
-    st.sidebar.metric("Total Entries", total_entries)
-    st.sidebar.metric("Days Tracked", unique_dates)
-    st.sidebar.metric("Total Protein", f"{total_protein:.0f} g")
-    st.sidebar.metric("Avg Daily Protein", f"{avg_daily_protein:.1f} g")
-else:
-    st.sidebar.info("Add entries to see stats!")
-
-# Close database connection when done
-conn.close()
\ No newline at end of file
+    with st.sidebar.expander("🐞 Performance"):
+        events = rerun_profile['events']
+        sql_events = [event for event in events if event['kind'] == 'sql']
+        st.metric("Rerun time", f"{rerun_profile['total_ms']:.0f} ms")
+        st.caption(f"{len(sql_events)} database calls · "
+                   f"{sum(event['ms'] for event in sql_events):.1f} ms in SQLite · "
+                   f"peak {rerun_profile['peak_kib'] or 0:.0f} KiB traced")
+        
+        if events:
+            events_df = pd.DataFrame([{
+                'Step': '\u2003' * event['depth'] + event['name'],
+                'Kind': event['kind'],
+                'ms': event['ms'],
+                'Rows': event['rows'],
+                'Alloc (KiB)': event['alloc_kib']
+            } for event in events])
+            st.dataframe(events_df, hide_index=True, use_container_width=True)
+        
+        st.download_button(
+            label="📥 Download JSON lines",
+            data=profiling.to_json_lines(profile_history),
+            file_name=f"food_tracker_profile_{datetime.date.today()}.jsonl",
+            mime="application/x-ndjson",
+            use_container_width=True
+        )
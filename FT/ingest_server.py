@@ -0,0 +1,332 @@
+"""Local HTTP API for logging Food Tracker entries from phones and scripts.
+
+Accepts single entries and bulk payloads as JSON, validates them with the
+same rules as Bulk Import and hands them to a write queue that commits
+everything arriving within a few milliseconds in one transaction, so many
+small clients cost one SQLite commit instead of one each.
+
+Entries that carry their own created_at are deduplicated, so resending
+them is safe. Entries without one are stamped on arrival and can only be
+retried safely with an Idempotency-Key header: a request repeating a key
+gets the response of the first one instead of being applied again.
+
+Usage:
+    python FT/ingest_server.py --port 8765
+    python FT/ingest_server.py --db people/alice/food_tracker.db --token s3cret
+
+    curl -X POST localhost:8765/entries -H 'Content-Type: application/json' -H 'Idempotency-Key: 5f1c' \\
+         -d '{"date": "2024-05-01", "category": "Lunch", "food": "Chicken salad", "protein": 35}'
+
+Endpoints:
+    POST /entries   one entry object, a list of them or {"entries": [...]}
+    GET  /health    queue and database status
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import hmac
+import json
+import os
+import sys
+
+import food_data
+
+MAX_BODY_BYTES = 5 * 1024 * 1024
+MAX_ENTRIES_PER_REQUEST = 10000
+COMMIT_WINDOW_SECONDS = 0.005
+COMMIT_MAX_ROWS = 5000
+IDEMPOTENCY_KEYS = 10000  # Most recent keys remembered, for as long as the server runs
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 422: 'Unprocessable Entity',
+           500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, details=None):
+        super().__init__(message)
+        self.status = status
+        self.body = {'error': message, **({'details': details} if details else {})}
+
+
+class GroupCommitQueue:
+    """Collects the rows of concurrent requests and writes them together.
+    
+    The first batch to arrive opens a short window; everything submitted
+    before it closes (or until max_rows is reached) goes into the same
+    transaction on the pool's writer thread."""
+    
+    def __init__(self, window=COMMIT_WINDOW_SECONDS, max_rows=COMMIT_MAX_ROWS):
+        self.window = window
+        self.max_rows = max_rows
+        self.commits = 0
+        self.rows_written = 0
+        self._pending = asyncio.Queue()
+        self._worker = None
+    
+    def start(self):
+        self._worker = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+    
+    @property
+    def pending(self):
+        return self._pending.qsize()
+    
+    async def submit(self, rows):
+        """Queue validated rows and wait for their commit. Returns how many
+        of them were new."""
+        future = asyncio.get_running_loop().create_future()
+        await self._pending.put((rows, future))
+        return await future
+    
+    async def _collect(self):
+        batches = [await self._pending.get()]
+        size = len(batches[0][0])
+        deadline = asyncio.get_running_loop().time() + self.window
+        while size < self.max_rows:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch = await asyncio.wait_for(self._pending.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batches.append(batch)
+            size += len(batch[0])
+        return batches
+    
+    async def _run(self):
+        while True:
+            batches = await self._collect()
+            try:
+                counts = await asyncio.to_thread(food_data.add_entry_batches, [rows for rows, _ in batches])
+            except Exception as error:
+                for _, future in batches:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.commits += 1
+            self.rows_written += sum(counts)
+            for (_, future), count in zip(batches, counts):
+                if not future.done():
+                    future.set_result(count)
+
+
+def parse_entries(payload):
+    """Validate an /entries payload into insert rows, or raise HTTPError
+    listing every invalid record. Entries without created_at are stamped
+    with the time they were received, like entries added in the app, one
+    microsecond apart so repeated items in a payload are all kept. Resending
+    them adds them again unless the request has an Idempotency-Key."""
+    if isinstance(payload, dict) and isinstance(payload.get('entries'), list):
+        records = payload['entries']
+    elif isinstance(payload, dict):
+        records = [payload]
+    elif isinstance(payload, list):
+        records = payload
+    else:
+        raise HTTPError(400, "expected an entry object, a list of entries or {\"entries\": [...]}")
+    if not records:
+        raise HTTPError(400, "no entries")
+    if len(records) > MAX_ENTRIES_PER_REQUEST:
+        raise HTTPError(413, f"at most {MAX_ENTRIES_PER_REQUEST} entries per request")
+    
+    now = datetime.datetime.now()
+    rows = []
+    errors = []
+    for number, record in enumerate(records, start=1):
+        try:
+            if isinstance(record, dict) and not record.get('created_at'):
+                created_at = now + datetime.timedelta(microseconds=number)
+                record = {**record, 'created_at': created_at.isoformat(timespec='microseconds')}
+            rows.append(food_data.validate_entry_record(record))
+        except ValueError as error:
+            errors.append(f"Record {number}: {error}")
+    if errors:
+        raise HTTPError(422, f"{len(errors)} invalid entries, nothing was saved", errors)
+    return rows
+
+
+class IngestServer:
+    """asyncio HTTP/1.1 server for the ingest endpoints"""
+    
+    def __init__(self, token=None, queue=None):
+        self.token = token
+        self.queue = queue or GroupCommitQueue()
+        self._responses = collections.OrderedDict()  # Idempotency-Key -> future of the first response
+    
+    async def _read_request(self, reader):
+        """Read one request. Returns None when the client closed the connection."""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(413, "headers too large")
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = request_line.split(' ')
+        except ValueError:
+            raise HTTPError(400, "malformed request line")
+        headers = {}
+        for line in header_lines:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, "invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"body larger than {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b''
+        keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+        return method, target.split('?', 1)[0], headers, body, keep_alive
+    
+    def _authorized(self, headers):
+        if not self.token:
+            return True
+        return hmac.compare_digest(headers.get('authorization', ''), f'Bearer {self.token}')
+    
+    async def _dispatch(self, method, path, headers, body):
+        if path == '/health':
+            if method != 'GET':
+                raise HTTPError(405, "use GET")
+            return 200, {
+                'status': 'ok',
+                'database': os.path.abspath(food_data.DB_PATH),
+                'pending_batches': self.queue.pending,
+                'commits': self.queue.commits,
+                'rows_written': self.queue.rows_written
+            }
+        
+        if path == '/entries':
+            if method != 'POST':
+                raise HTTPError(405, "use POST")
+            if not self._authorized(headers):
+                raise HTTPError(401, "missing or invalid bearer token")
+            key = headers.get('idempotency-key')
+            if key is None:
+                return await self._ingest(body)
+            if not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+                raise HTTPError(400, f"Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+            return await self._ingest_once(key, body)
+        
+        raise HTTPError(404, f"no such endpoint {path}")
+    
+    async def _ingest(self, body):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "body is not valid JSON")
+        rows = parse_entries(payload)
+        inserted = await self.queue.submit(rows)
+        return 201, {'received': len(rows), 'inserted': inserted, 'duplicates': len(rows) - inserted}
+    
+    async def _ingest_once(self, key, body):
+        """Ingest a request unless one with the same key came before, in which
+        case its response is returned (after waiting for it if still running)"""
+        if key in self._responses:
+            self._responses.move_to_end(key)
+            return await asyncio.shield(self._responses[key])
+        first = asyncio.get_running_loop().create_future()
+        self._responses[key] = first
+        while len(self._responses) > IDEMPOTENCY_KEYS:
+            self._responses.popitem(last=False)
+        try:
+            response = await self._ingest(body)
+        except Exception as error:
+            # Nothing was saved, so a retry with the same key tries again
+            self._responses.pop(key, None)
+            first.set_exception(error)
+            first.exception()  # Mark it retrieved, concurrent retries still get it
+            raise
+        except asyncio.CancelledError:
+            self._responses.pop(key, None)
+            first.cancel()
+            raise
+        first.set_result(response)
+        return response
+    
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body, keep_alive = request
+                    status, response = await self._dispatch(method, path, headers, body)
+                except HTTPError as error:
+                    status, response = error.status, error.body
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as error:
+                    status, response = 500, {'error': f"{type(error).__name__}: {error}"}
+                
+                data = json.dumps(response).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    async def serve(self, host, port, ready=None):
+        """Run until cancelled"""
+        food_data.get_pool()  # Create the schema before the first request
+        self.queue.start()
+        server = await asyncio.start_server(self.handle, host, port)
+        if ready:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.queue.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument('--db', help="database file (default: the app's food_tracker.db)")
+    parser.add_argument('--token', default=os.environ.get('FOOD_TRACKER_INGEST_TOKEN'),
+                        help="require 'Authorization: Bearer <token>' on writes "
+                             "(default: $FOOD_TRACKER_INGEST_TOKEN)")
+    parser.add_argument('--window-ms', type=float, default=COMMIT_WINDOW_SECONDS * 1000,
+                        help="how long a commit waits for more entries (default: 5)")
+    args = parser.parse_args(argv)
+    
+    if args.db:
+        food_data.use_database(args.db)
+    if args.host not in ('127.0.0.1', 'localhost', '::1') and not args.token:
+        print("Warning: listening beyond localhost without --token, anyone on the network can add entries")
+    
+    server = IngestServer(args.token, GroupCommitQueue(window=args.window_ms / 1000))
+    ready = lambda _: print(f"Ingesting into {food_data.DB_PATH} on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        food_data.close_pool()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
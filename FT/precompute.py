@@ -0,0 +1,218 @@
+"""Background precomputation of the expensive per-page artifacts.
+
+Pages ask for artifacts (the daily table, chart series, goal analytics and
+exports) by name and arguments through get_artifact(). The first request
+computes the artifact inline and registers it. Each result is published
+under the range version (food_data.get_range_version) of the dates it
+reads, so only writes to those dates make it stale. After every write a
+worker thread per database recomputes the registered artifacts that went
+stale. Page renders read the latest published result; if its recompute has
+not finished within STALE_WAIT_SECONDS, the previous result is returned
+and marked stale.
+
+The worker leaves exports alone, they are computed again when asked for
+after a change to their dates. Set FOOD_TRACKER_PRECOMPUTE=0 to compute
+everything inline instead.
+"""
+import collections
+import datetime
+import os
+import threading
+import time
+
+import food_data
+from profiling import profiled
+
+ENABLED = os.environ.get('FOOD_TRACKER_PRECOMPUTE', '1') != '0'
+STALE_WAIT_SECONDS = 0.5
+POLL_SECONDS = 2.0  # Also catches writes made by other processes
+DEBOUNCE_SECONDS = 0.05
+MAX_ARTIFACTS = 16
+MAX_VARIANTS = 2  # Per artifact name, e.g. the analytics of the current and the previous goal
+
+ARTIFACTS = {
+    'daily_table': food_data.transform_to_daily_table,
+    'charts': food_data.create_protein_charts,
+    'goal_analytics': food_data.get_goal_analytics,
+    'csv': lambda *filters: ''.join(food_data.iter_daily_csv(*filters)).encode('utf-8'),
+    'pdf': lambda *filters: food_data.create_pdf_report(None, *filters).getvalue()
+}
+ON_DEMAND_ARTIFACTS = {'csv', 'pdf'}  # Too heavy to rebuild after every write
+
+
+def _filter_dates(start_date=None, end_date=None, *_):
+    return start_date, end_date
+
+
+def _goal_analytics_dates(goal, start_date=None, end_date=None, *_):
+    """The rolling averages also read the lookback days before the range"""
+    if start_date:
+        start_date = (datetime.date.fromisoformat(str(start_date))
+                      - datetime.timedelta(days=food_data.ROLLING_LOOKBACK_DAYS))
+    return start_date, end_date
+
+
+# Dates an artifact reads, from its arguments. Writes to other dates keep it fresh.
+DATE_RANGES = {
+    'goal_analytics': _goal_analytics_dates
+}
+
+
+def _date_range(key):
+    """(start_date, end_date) of the entries an artifact reads"""
+    name, args = key
+    return DATE_RANGES.get(name, _filter_dates)(*args)
+
+
+class Precomputer:
+    """Versioned artifact cache of one database, kept fresh by a worker thread"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.recomputes = 0
+        self.last_used = time.monotonic()  # Of the last get_precomputer() call for it
+        self._results = collections.OrderedDict()  # (name, args) -> (range version, value)
+        self._lock = threading.Lock()
+        self._published = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._pool = None
+        self._checked_version = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='food-tracker-precompute', daemon=True)
+        self._thread.start()
+    
+    def _current_pool(self):
+        """The database's pool, listening to its writes. Pools are recreated
+        when a database is closed, or evicted, and opened again."""
+        pool = food_data.get_pool(self.path)
+        with self._lock:
+            if pool is not self._pool:
+                pool.add_write_listener(self._wake.set)
+                self._pool = pool
+        return pool
+    
+    def _compute(self, key):
+        name, args = key
+        return ARTIFACTS[name](*args)
+    
+    def _publish(self, key, version, value):
+        with self._published:
+            self._results[key] = (version, value)
+            self._results.move_to_end(key)
+            variants = [other for other in self._results if other[0] == key[0]]
+            for other in variants[:-MAX_VARIANTS]:
+                del self._results[other]
+            while len(self._results) > MAX_ARTIFACTS:
+                self._results.popitem(last=False)
+            self._published.notify_all()
+    
+    def get(self, name, *args, wait=STALE_WAIT_SECONDS):
+        """Latest result of an artifact and whether it is stale. Runs on the
+        caller's thread, which must have this database selected."""
+        key = (name, args)
+        self._current_pool()
+        version = food_data.get_range_version(*_date_range(key))
+        with self._lock:
+            published = self._results.get(key)
+            if published is not None:
+                self._results.move_to_end(key)
+        if published is None or (name in ON_DEMAND_ARTIFACTS and published[0] != version):
+            value = self._compute(key)
+            self._publish(key, version, value)
+            return value, False
+        
+        if published[0] != version:
+            self._wake.set()
+            with self._published:
+                self._published.wait_for(lambda: key not in self._results or self._results[key][0] == version,
+                                         timeout=wait)
+                published = self._results.get(key, published)
+        return published[1], published[0] != version
+    
+    def _stale_keys(self):
+        """Registered artifacts whose dates changed since they were computed,
+        most recently used first, with the range version to publish them under"""
+        with self._lock:
+            registered = [(key, published) for key, (published, _) in reversed(self._results.items())
+                          if key[0] not in ON_DEMAND_ARTIFACTS]
+        versions = {}
+        stale = []
+        for key, published in registered:
+            date_range = _date_range(key)
+            if date_range not in versions:
+                versions[date_range] = food_data.get_range_version(*date_range)
+            if versions[date_range] != published:
+                stale.append((key, versions[date_range]))
+        return stale
+    
+    def _run(self):
+        food_data.use_session_database(self.path)
+        while not self._closed:
+            woken = self._wake.wait(POLL_SECONDS)
+            if self._closed:
+                return
+            time.sleep(DEBOUNCE_SECONDS)  # Let a burst of writes land first
+            self._wake.clear()
+            pool = self._pool
+            if pool is None or pool.closed:
+                # Evicted as unused, don't reopen it just to poll. The next
+                # request opens a new pool and registers with it.
+                continue
+            data_version = pool.data_version()
+            if not woken and data_version == self._checked_version:
+                continue
+            for key, version in self._stale_keys():
+                try:
+                    self._publish(key, version, self._compute(key))
+                    self.recomputes += 1
+                except Exception:
+                    # Forget it, the next request computes it inline and shows the error
+                    with self._lock:
+                        self._results.pop(key, None)
+                if self._wake.is_set():  # Another write landed, start over
+                    break
+            else:
+                self._checked_version = data_version
+    
+    def close(self, wait=True):
+        """Stop the worker, after the artifact it is computing unless wait is False"""
+        self._closed = True
+        self._wake.set()
+        if self._pool is not None:
+            self._pool.remove_write_listener(self._wake.set)
+        if wait:
+            self._thread.join()
+
+
+_precomputers = collections.OrderedDict()  # Least recently used first
+_precomputers_lock = threading.Lock()
+
+
+def get_precomputer(path=None):
+    """Precomputer of a database file, started on first use. Like their
+    caches and connection pools, only the CACHED_DATABASES most recently used
+    files and those used within IDLE_DATABASE_SECONDS keep theirs."""
+    path = path or food_data.current_database()
+    now = time.monotonic()
+    with _precomputers_lock:
+        precomputer = _precomputers.pop(path, None) or Precomputer(path)
+        precomputer.last_used = now
+        _precomputers[path] = precomputer
+        evicted = []
+        for old_path, old in list(_precomputers.items())[:-1]:
+            if (len(_precomputers) <= food_data.CACHED_DATABASES
+                    or now - old.last_used < food_data.IDLE_DATABASE_SECONDS):
+                break
+            evicted.append(_precomputers.pop(old_path))
+    for old in evicted:
+        old.close(wait=False)
+    return precomputer
+
+
+@profiled('precompute')
+def get_artifact(name, *args):
+    """Latest result of an artifact for the current database, and whether it
+    is stale. Arguments are positional and must be hashable."""
+    if not ENABLED:
+        return ARTIFACTS[name](*args), False
+    return get_precomputer().get(name, *args)
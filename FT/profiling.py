@@ -0,0 +1,182 @@
+"""Opt-in per-rerun performance instrumentation.
+
+A profile covers one Streamlit rerun (or any other unit of work started
+with start_rerun) on the current thread. While it is active, functions
+decorated with @profiled, explicit spans and the SQL run on pooled
+connections are recorded with their wall time, row count and net memory
+allocated. Without an active profile the wrappers just call through.
+
+Set FOOD_TRACKER_PROFILE=1 to profile every rerun, and
+FOOD_TRACKER_PROFILE_LOG=<path> to append each finished rerun to a JSON
+lines file for offline analysis.
+"""
+import contextlib
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+ENABLED_BY_DEFAULT = os.environ.get('FOOD_TRACKER_PROFILE', '') not in ('', '0')
+LOG_PATH = os.environ.get('FOOD_TRACKER_PROFILE_LOG')
+MAX_STATEMENT_LENGTH = 200
+
+_state = threading.local()
+_tracing_lock = threading.Lock()
+_tracing_reruns = 0
+
+
+def result_rows(result):
+    """Row count of a function result, when it has one"""
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if isinstance(result, list) or hasattr(result, 'shape'):
+        return len(result)
+    return None
+
+
+def _traced_memory():
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+class Span:
+    """One timed piece of work inside a rerun profile"""
+
+    def __init__(self, profile, name, kind):
+        self.profile = profile
+        self.name = name
+        self.kind = kind
+        self.depth = profile.depth
+        self.statements = []
+        self._memory = _traced_memory()
+        self._start = time.perf_counter()
+        profile.depth += 1
+
+    def add_statement(self, statement):
+        """sqlite3 trace callback: remember the SQL this span ran"""
+        self.statements.append(' '.join(statement.split())[:MAX_STATEMENT_LENGTH])
+
+    def finish(self, result=None):
+        elapsed = time.perf_counter() - self._start
+        self.profile.depth -= 1
+        event = {
+            'start_ms': round((self._start - self.profile.start) * 1000, 3),
+            'name': self.name,
+            'kind': self.kind,
+            'depth': self.depth,
+            'ms': round(elapsed * 1000, 3),
+            'rows': result_rows(result),
+            'alloc_kib': round((_traced_memory() - self._memory) / 1024, 1)
+        }
+        if self.statements:
+            event['statements'] = self.statements
+        self.profile.events.append(event)
+
+
+class RerunProfile:
+    """Everything recorded during one rerun"""
+
+    def __init__(self, label, trace_memory):
+        self.label = label
+        self.trace_memory = trace_memory
+        self.started_at = datetime.datetime.now().isoformat(timespec='milliseconds')
+        self.events = []
+        self.depth = 0
+        self.start = time.perf_counter()
+
+    def to_dict(self):
+        return {
+            'label': self.label,
+            'started_at': self.started_at,
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 3),
+            'peak_kib': round(tracemalloc.get_traced_memory()[1] / 1024, 1) if self.trace_memory else None,
+            'events': sorted(self.events, key=lambda event: event['start_ms'])
+        }
+
+
+def current():
+    """The profile active on this thread, or None"""
+    return getattr(_state, 'profile', None)
+
+
+def start_rerun(label='', trace_memory=True):
+    """Start profiling the current thread's work. Memory tracing uses
+    tracemalloc, which is process-wide, so allocations made by other
+    sessions at the same time are counted too."""
+    global _tracing_reruns
+    if current() is not None:
+        finish_rerun()
+    if trace_memory:
+        with _tracing_lock:
+            if _tracing_reruns == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            _tracing_reruns += 1
+            tracemalloc.reset_peak()
+    _state.profile = RerunProfile(label, trace_memory)
+    return _state.profile
+
+
+def finish_rerun():
+    """Stop profiling the current thread and return the rerun as a dict"""
+    global _tracing_reruns
+    profile = current()
+    if profile is None:
+        return None
+    _state.profile = None
+    record = profile.to_dict()
+    if profile.trace_memory:
+        with _tracing_lock:
+            _tracing_reruns -= 1
+            if _tracing_reruns == 0:
+                tracemalloc.stop()
+    if LOG_PATH:
+        with open(LOG_PATH, 'a') as log_file:
+            log_file.write(json.dumps(record) + '\n')
+    return record
+
+
+def begin(name, kind):
+    """Open a span on the active profile, or return None when not profiling"""
+    profile = current()
+    return Span(profile, name, kind) if profile is not None else None
+
+
+def end(span, result=None):
+    """Close a span returned by begin()"""
+    if span is not None:
+        span.finish(result)
+
+
+@contextlib.contextmanager
+def span(name, kind):
+    """Record the enclosed block as one span"""
+    opened = begin(name, kind)
+    try:
+        yield opened
+    finally:
+        end(opened)
+
+
+def profiled(kind):
+    """Decorator recording each call of a function as a span"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            opened = begin(function.__name__, kind)
+            if opened is None:
+                return function(*args, **kwargs)
+            result = None
+            try:
+                result = function(*args, **kwargs)
+                return result
+            finally:
+                end(opened, result)
+        return wrapper
+    return decorator
+
+
+def to_json_lines(records):
+    """Serialize rerun records as JSON lines"""
+    return ''.join(json.dumps(record) + '\n' for record in records)
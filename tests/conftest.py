@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'FT'))
+
+import food_data
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh database, selected for every thread so nothing touches the
+    app's own food_tracker.db"""
+    path = str(tmp_path / 'food_tracker.db')
+    monkeypatch.setattr(food_data, 'DB_PATH', path)
+    food_data.use_session_database(path)
+    yield path
+    food_data.close_pool(path)
+    food_data.use_session_database(None)
+
+
+def entry(date, category, food, protein=10, beverage='', created_at=None):
+    return {'date': date, 'category': category, 'food': food, 'beverage': beverage, 'protein': protein,
+            'notes': '', 'created_at': created_at or f'{date}T12:00:00'}
@@ -0,0 +1,51 @@
+import hashlib
+import os
+import sqlite3
+
+import pytest
+
+import batch_report
+import food_data
+from conftest import entry
+
+
+def digest(path):
+    with open(path, 'rb') as database:
+        return hashlib.sha256(database.read()).hexdigest()
+
+
+@pytest.fixture
+def report_process(monkeypatch):
+    """Undo the process-wide settings generate_reports makes in its worker"""
+    monkeypatch.setattr(food_data, 'DB_PATH', food_data.DB_PATH)
+    monkeypatch.setattr(food_data, 'SNAPSHOT_ENABLED', food_data.SNAPSHOT_ENABLED)
+
+
+def test_reports_leave_the_database_untouched(tmp_path, report_process):
+    path = str(tmp_path / 'alice.db')
+    food_data.use_session_database(path)
+    food_data.add_entry(entry('2024-01-01', 'Lunch', 'Eggs', protein=20))
+    food_data.close_pool(path)
+    food_data.use_session_database(None)
+    before = digest(path)
+
+    result = batch_report.generate_reports(path, str(tmp_path), 'alice', categories=['Lunch'])
+    assert result['entries'] == 1 and len(result['files']) == 3
+    assert digest(path) == before
+    assert not os.path.exists(food_data.snapshot_dir(path))
+
+
+def test_reports_refuse_databases_in_an_older_format(tmp_path, report_process):
+    path = str(tmp_path / 'legacy.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('''CREATE TABLE food_entries (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL,
+                        category TEXT NOT NULL, food TEXT NOT NULL, beverage TEXT NOT NULL,
+                        protein INTEGER DEFAULT 0, notes TEXT, created_at TEXT)''')
+        conn.execute("INSERT INTO food_entries VALUES (1, '2024-01-01', 'Lunch', 'Eggs', '', 20, '', '')")
+    conn.close()
+    before = digest(path)
+
+    with pytest.raises(ValueError, match="older database format"):
+        batch_report.generate_reports(path, str(tmp_path), 'legacy')
+    assert digest(path) == before
+    assert sorted(os.listdir(tmp_path)) == ['legacy.db']
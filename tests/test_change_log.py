@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+import food_data
+from conftest import entry
+
+
+def history():
+    return {change['label']: change for change in food_data.get_change_history(limit=50)}
+
+
+def add_eggs():
+    food_data.add_entry(entry('2024-01-01', 'Lunch', 'Eggs', 10))
+    with food_data.get_pool().reader() as conn:
+        return conn.execute('SELECT id FROM food_entries').fetchone()[0]
+
+
+def foods():
+    with food_data.get_pool().reader() as conn:
+        return conn.execute('SELECT food, protein FROM food_entries ORDER BY id').fetchall()
+
+
+def test_undo_is_refused_after_a_redo_deleted_the_entry(db):
+    entry_id = add_eggs()
+    food_data.update_entry(entry_id, entry('2024-01-01', 'Lunch', 'Omelette', 20))
+    food_data.delete_entry(entry_id)
+    edit = history()['Edited Eggs']['id']
+    food_data.undo_change(history()['Deleted Omelette']['id'])
+    food_data.undo_change(history()['Undo Deleted Omelette']['id'])  # Redo the delete
+    assert foods() == []
+    
+    with pytest.raises(ValueError, match="Redo Deleted Omelette"):
+        food_data.undo_change(edit)
+    assert not history()['Edited Eggs']['undone']
+    assert foods() == []
+
+
+def test_undo_after_a_later_change_was_undone(db):
+    entry_id = add_eggs()
+    food_data.update_entry(entry_id, entry('2024-01-01', 'Lunch', 'Omelette', 20))
+    food_data.delete_entry(entry_id)
+    food_data.undo_change(history()['Deleted Omelette']['id'])
+    assert foods() == [('Omelette', 20)]
+    
+    food_data.undo_change(history()['Edited Eggs']['id'])
+    assert foods() == [('Eggs', 10)]
+    assert history()['Edited Eggs']['undone']
+
+
+def test_undo_redo_chain_of_a_later_change(db):
+    entry_id = add_eggs()
+    food_data.update_entry(entry_id, entry('2024-01-01', 'Lunch', 'Omelette', 20))
+    food_data.delete_entry(entry_id)
+    food_data.undo_change(history()['Deleted Omelette']['id'])  # Undo
+    food_data.undo_change(history()['Undo Deleted Omelette']['id'])  # Redo
+    food_data.undo_change(history()['Redo Deleted Omelette']['id'])  # Undo the redo
+    assert foods() == [('Omelette', 20)]
+    
+    food_data.undo_change(history()['Edited Eggs']['id'])
+    assert foods() == [('Eggs', 10)]
+
+
+def test_undo_is_refused_while_a_later_change_is_in_effect(db):
+    entry_id = add_eggs()
+    food_data.update_entry(entry_id, entry('2024-01-01', 'Lunch', 'Omelette', 20))
+    food_data.update_entry(entry_id, entry('2024-01-01', 'Lunch', 'Frittata', 25))
+    with pytest.raises(ValueError, match="Edited Omelette"):
+        food_data.undo_change(history()['Edited Eggs']['id'])
+
+
+def test_undo_twice_is_refused(db):
+    add_eggs()
+    added = history()['Added Eggs']['id']
+    food_data.undo_change(added)
+    with pytest.raises(ValueError, match="already undone"):
+        food_data.undo_change(added)
+
+
+def test_undo_is_refused_when_entries_changed_outside_the_app(db):
+    entry_id = add_eggs()
+    food_data.update_entry(entry_id, entry('2024-01-01', 'Lunch', 'Omelette', 20))
+    with sqlite3.connect(db) as conn:
+        conn.execute('DELETE FROM food_entries')
+    batches = len(food_data.get_change_history(limit=50))
+    
+    with pytest.raises(ValueError, match="outside the app"):
+        food_data.undo_change(history()['Edited Eggs']['id'])
+    assert len(food_data.get_change_history(limit=50)) == batches
+    assert not history()['Edited Eggs']['undone']
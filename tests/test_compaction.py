@@ -0,0 +1,60 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import batch_report
+import food_data
+from conftest import entry
+
+DAY = [
+    entry('2020-03-01', 'Breakfast', 'Eggs', 20, 'Coffee', '2020-03-01T08:00:00'),
+    entry('2020-03-01', 'Lunch', 'Salad', 15, 'Water', '2020-03-01T12:00:00'),
+    entry('2020-03-01', 'Breakfast', 'Toast', 5, 'Tea', '2020-03-01T14:00:00'),
+    entry('2020-03-01', 'Dinner', 'Fish', 30, '', '2020-03-01T19:00:00'),
+    entry('2020-03-01', 'Snacks', 'Nuts', 6, 'Juice', '2020-03-01T21:00:00'),
+    entry('2020-03-02', 'Lunch', 'Soup', 10, 'Water', '2020-03-02T12:00:00'),
+    entry('2020-03-02', 'Lunch', 'Bread', 4, 'Soda', '2020-03-02T12:30:00'),
+    entry('2024-01-01', 'Lunch', 'Chicken', 35, 'Water', '2024-01-01T12:00:00')
+]
+
+
+@pytest.mark.parametrize('categories', [None, ('Breakfast',), ('Lunch', 'Snacks')])
+def test_compaction_keeps_daily_tables_and_exports(db, categories):
+    for row in DAY:
+        food_data.add_entry(row)
+    before = (food_data.transform_to_daily_table(categories=categories),
+              ''.join(food_data.iter_daily_csv(categories=categories)),
+              food_data.get_stats(categories=categories))
+    
+    result = food_data.compact_entries(before='2021-01-01')
+    assert result['days'] == 2
+    after = (food_data.transform_to_daily_table(categories=categories),
+             ''.join(food_data.iter_daily_csv(categories=categories)),
+             food_data.get_stats(categories=categories))
+    
+    columns = food_data.DAILY_TABLE_COLUMNS
+    pd.testing.assert_frame_equal(before[0][columns], after[0][columns])
+    assert before[1] == after[1]
+    assert before[2]['total_protein'] == after[2]['total_protein']
+
+
+def test_interleaved_beverages_keep_their_order(db):
+    for row in DAY[:3]:
+        food_data.add_entry(row)
+    food_data.compact_entries(before='2021-01-01')
+    table = food_data.transform_to_daily_table()
+    assert table.loc[0, 'Beverage'] == 'Tea, Water, Coffee'
+    assert table.loc[0, 'Breakfast'] == 'Toast, Eggs'
+
+
+def test_archives_are_not_picked_up_as_databases(db, tmp_path):
+    for row in DAY:
+        food_data.add_entry(row)
+    result = food_data.compact_entries(before='2021-01-01', archive=True)
+    with sqlite3.connect(result['archive']) as archive:
+        assert archive.execute('SELECT COUNT(*) FROM food_entries').fetchone()[0] == 7
+    archive.close()
+    legacy = str(tmp_path / 'bob.archive.db')
+    open(legacy, 'w').close()
+    assert batch_report.expand_databases([str(tmp_path / '*.db')]) == [db]
@@ -0,0 +1,62 @@
+import datetime
+import random
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import food_data
+from conftest import entry
+
+FOODS = ['Eggs', 'Toast', 'Chicken', 'Rice', 'Salmon', 'Apple', 'Yogurt']
+BEVERAGES = ['', '', 'Water', 'Coffee', 'Tea']
+
+
+def baseline_daily_table(path):
+    """The daily table as the app first built it, one loop over every entry"""
+    with sqlite3.connect(path) as conn:
+        entries = conn.execute('SELECT date, category, food, beverage, protein FROM food_entries '
+                               'ORDER BY date DESC, created_at DESC').fetchall()
+    daily_data = []
+    for date in sorted({row[0] for row in entries}, reverse=True):
+        day_row = {'Date': date, 'Breakfast': '', 'Lunch': '', 'Snacks': '', 'Dinner': '',
+                   'Beverage': '', 'Protein Intake': 0}
+        for _, category, food, beverage, protein in (row for row in entries if row[0] == date):
+            day_row[category] = f"{day_row[category]}, {food}" if day_row[category] else food
+            if beverage:
+                day_row['Beverage'] = f"{day_row['Beverage']}, {beverage}" if day_row['Beverage'] else beverage
+            day_row['Protein Intake'] += protein
+        daily_data.append(day_row)
+    return pd.DataFrame(daily_data)
+
+
+def random_entry(rng, number):
+    date = datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(20))
+    created_at = datetime.datetime.combine(date, datetime.time(rng.randrange(24), rng.randrange(60)))
+    return entry(date.isoformat(), rng.choice(food_data.MEAL_CATEGORIES), rng.choice(FOODS),
+                 protein=rng.randrange(60), beverage=rng.choice(BEVERAGES),
+                 created_at=f'{created_at.isoformat()}.{number:06d}')
+
+
+def assert_parity(path):
+    expected = baseline_daily_table(path)
+    daily = food_data.transform_to_daily_table().reset_index(drop=True)
+    pd.testing.assert_frame_equal(daily, expected, check_dtype=False)
+    assert ''.join(food_data.iter_daily_csv()) == expected.to_csv(index=False)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_daily_table_matches_the_original_after_edits(db, seed):
+    rng = random.Random(seed)
+    food_data.import_entries([random_entry(rng, number) for number in range(150)])
+    food_data.add_entry(random_entry(rng, 150))
+    assert_parity(db)
+
+    with sqlite3.connect(db) as conn:
+        ids = [row[0] for row in conn.execute('SELECT id FROM food_entries')]
+    edited = rng.sample(ids, 50)
+    food_data.apply_edits({entry_id: random_entry(rng, number) for number, entry_id in enumerate(edited[:30], start=151)},
+                          edited[30:])
+    food_data.update_entry(edited[0], random_entry(rng, 200))
+    food_data.delete_entry(edited[1])
+    assert_parity(db)
@@ -0,0 +1,38 @@
+import pytest
+
+import food_data
+
+
+def record(protein):
+    return {'date': '2024-01-01', 'category': 'lunch', 'food': 'Eggs', 'protein': protein}
+
+
+@pytest.mark.parametrize('protein', ['inf', '-inf', 'nan', '1e400', float('inf'), 10 ** 400, 'lots'])
+def test_invalid_protein_is_rejected(protein):
+    with pytest.raises(ValueError, match="protein"):
+        food_data.validate_entry_record(record(protein))
+
+
+def test_protein_is_truncated_to_grams():
+    assert food_data.validate_entry_record(record('12.7'))[4] == 12
+
+
+@pytest.mark.parametrize('payload', ['5', '"entries"', '{"entries": 3}', 'null'])
+def test_json_import_must_be_a_list(payload):
+    with pytest.raises(ValueError):
+        food_data.read_import_file('food_log.json', payload)
+
+
+def test_json_import_with_infinite_protein_skips_the_record(db):
+    records = food_data.read_import_file('food_log.json', '[{"date": "2024-01-01", "category": "Lunch", '
+                                                          '"food": "Eggs", "protein": 1e400}]')
+    result = food_data.import_entries(records)
+    assert (result['imported'], result['invalid']) == (0, 1)
+
+
+def test_repeated_records_without_created_at_are_all_imported(db):
+    coffee = {'date': '2024-01-01', 'category': 'Snacks', 'food': 'Coffee', 'protein': 1}
+    result = food_data.import_entries([coffee, coffee, {**coffee, 'date': '2024-01-02'}])
+    assert (result['imported'], result['duplicates']) == (3, 0)
+    result = food_data.import_entries([coffee, coffee, {**coffee, 'date': '2024-01-02'}])
+    assert (result['imported'], result['duplicates']) == (0, 3)
@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import food_data
+import ingest_server
+
+
+async def post(port, payload, headers=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode() if not isinstance(payload, bytes) else payload
+    head = ''.join(f'{name}: {value}\r\n' for name, value in (headers or {}).items())
+    writer.write(f'POST /entries HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n{head}\r\n'
+                 .encode() + body)
+    response = await reader.read()
+    writer.close()
+    status = int(response.split(b' ', 2)[1])
+    return status, json.loads(response.split(b'\r\n\r\n', 1)[1])
+
+
+def run_with_server(client):
+    async def main():
+        server = ingest_server.IngestServer()
+        ready = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(server.serve('127.0.0.1', 0, ready.set_result))
+        port = (await ready).sockets[0].getsockname()[1]
+        try:
+            return await client(port)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    return asyncio.run(main())
+
+
+LUNCH = {'date': '2024-05-01', 'category': 'Lunch', 'food': 'Chicken salad', 'protein': 35}
+
+
+def test_retry_with_idempotency_key_is_applied_once(db):
+    async def client(port):
+        headers = {'Idempotency-Key': 'lunch-1'}
+        first = await post(port, LUNCH, headers)
+        retries = await asyncio.gather(*(post(port, LUNCH, headers) for _ in range(3)))
+        return first, retries
+    first, retries = run_with_server(client)
+    assert first == (201, {'received': 1, 'inserted': 1, 'duplicates': 0})
+    assert all(retry == first for retry in retries)
+    assert food_data.count_entries() == 1
+
+
+def test_entries_with_created_at_are_deduplicated(db):
+    async def client(port):
+        entry = {**LUNCH, 'created_at': '2024-05-01T12:00:00'}
+        return [await post(port, entry) for _ in range(2)]
+    first, second = run_with_server(client)
+    assert first[1]['inserted'] == 1 and second[1] == {'received': 1, 'inserted': 0, 'duplicates': 1}
+
+
+def test_invalid_entries_are_rejected_without_saving(db):
+    async def client(port):
+        return await post(port, b'[{"date": "2024-05-01", "category": "Lunch", "food": "Eggs", "protein": 1e400}]',
+                          {'Idempotency-Key': 'bad'})
+    status, body = run_with_server(client)
+    assert status == 422 and 'protein' in body['details'][0]
+    assert food_data.count_entries() == 0
+
+
+def test_repeated_entries_in_one_payload_are_all_saved(db):
+    async def client(port):
+        coffee = {'date': '2024-05-01', 'category': 'Snacks', 'food': 'Coffee'}
+        return await post(port, [coffee, coffee])
+    assert run_with_server(client) == (201, {'received': 2, 'inserted': 2, 'duplicates': 0})
+    assert food_data.count_entries() == 2
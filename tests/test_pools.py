@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+import food_data
+import precompute
+from conftest import entry
+
+
+def open_databases(tmp_path, count):
+    paths = [str(tmp_path / f'user{number}.db') for number in range(count)]
+    for path in paths:
+        food_data.use_session_database(path)
+        food_data.add_entry(entry('2024-01-01', 'Lunch', path))
+    return paths
+
+
+def close_all(paths):
+    for path in paths:
+        food_data.close_pool(path)
+    food_data.use_session_database(None)
+
+
+@pytest.fixture
+def no_grace_period(monkeypatch):
+    """Evict beyond the limit as soon as files are idle"""
+    monkeypatch.setattr(food_data, 'IDLE_DATABASE_SECONDS', 0)
+
+
+def test_idle_pools_are_closed_beyond_the_cache_limit(tmp_path, no_grace_period):
+    paths = open_databases(tmp_path, food_data.CACHED_DATABASES + 4)
+    try:
+        assert set(food_data._pools) == set(paths[-food_data.CACHED_DATABASES:])
+        writers = [thread for thread in threading.enumerate() if thread.name == 'food-tracker-writer']
+        assert len(writers) <= food_data.CACHED_DATABASES
+    finally:
+        close_all(paths)
+
+
+def test_a_pool_held_across_eviction_keeps_working(tmp_path, no_grace_period):
+    first = str(tmp_path / 'first.db')
+    held = food_data.get_pool(first)
+    paths = open_databases(tmp_path, food_data.CACHED_DATABASES + 1)
+    try:
+        assert held.closed
+        food_data.use_session_database(first)
+        held.write(food_data._add_entry, entry('2024-01-02', 'Dinner', 'Fish'))
+        with held.reader() as conn:
+            assert conn.execute('SELECT food FROM food_entries').fetchall() == [('Fish',)]
+        assert held.data_version() == food_data.get_pool(first).data_version()
+    finally:
+        close_all(paths + [first])
+
+
+def test_pools_in_use_are_not_evicted(tmp_path, no_grace_period):
+    first = str(tmp_path / 'first.db')
+    pool = food_data.get_pool(first)
+    paths = []
+    try:
+        with pool.reader():
+            paths = open_databases(tmp_path, food_data.CACHED_DATABASES + 1)
+            assert not pool.closed
+    finally:
+        close_all(paths + [first])
+
+
+def test_precomputers_are_stopped_beyond_the_cache_limit(tmp_path, no_grace_period):
+    paths = open_databases(tmp_path, food_data.CACHED_DATABASES + 2)
+    try:
+        precomputers = []
+        for path in paths:
+            food_data.use_session_database(path)
+            precomputers.append(precompute.get_precomputer())
+            assert precompute.get_artifact('daily_table', None, None, None)[0]['Lunch'].tolist() == [path]
+        assert set(precompute._precomputers) == set(paths[-food_data.CACHED_DATABASES:])
+        for evicted in precomputers[:2]:
+            evicted._thread.join(timeout=5)
+            assert not evicted._thread.is_alive()
+    finally:
+        for precomputer in precompute._precomputers.values():
+            precomputer.close()
+        precompute._precomputers.clear()
+        close_all(paths)
+
+
+def test_recently_used_pools_are_kept_beyond_the_cache_limit(tmp_path):
+    paths = open_databases(tmp_path, food_data.CACHED_DATABASES + 1)
+    try:
+        pools = {path: food_data.get_pool(path) for path in paths}
+        for path in paths:
+            food_data.use_session_database(path)
+            food_data.get_stats()
+        assert {path: food_data.get_pool(path) for path in paths} == pools
+    finally:
+        close_all(paths)
+
+
+def test_opening_a_pool_does_not_hold_up_other_files(tmp_path, monkeypatch):
+    slow, fast = str(tmp_path / 'slow.db'), str(tmp_path / 'fast.db')
+    started, release = threading.Event(), threading.Event()
+    init_db = food_data.init_db
+
+    def slow_init_db(conn):
+        if conn.execute('PRAGMA database_list').fetchone()[2] == slow:
+            started.set()
+            release.wait(10)
+        init_db(conn)
+    monkeypatch.setattr(food_data, 'init_db', slow_init_db)
+    opener = threading.Thread(target=food_data.get_pool, args=(slow,))
+    opener.start()
+    try:
+        assert started.wait(10)
+        other = threading.Thread(target=food_data.get_pool, args=(fast,))
+        other.start()
+        other.join(5)
+        assert not other.is_alive()
+    finally:
+        release.set()
+        opener.join()
+        close_all([slow, fast])
@@ -0,0 +1,79 @@
+import time
+
+import food_data
+import precompute
+from conftest import entry
+
+
+def settle():
+    """Give the worker time to pick up the last write"""
+    time.sleep(precompute.DEBOUNCE_SECONDS + 0.3)
+
+
+def test_writes_outside_the_date_range_keep_the_artifact(db):
+    food_data.add_entry(entry('2024-03-01', 'Lunch', 'Chicken', protein=30))
+    precomputer = precompute.Precomputer(db)
+    try:
+        table, stale = precomputer.get('daily_table', '2024-01-01', '2024-12-31', None)
+        food_data.add_entry(entry('2023-06-01', 'Lunch', 'Fish', protein=25))
+        settle()
+        assert precomputer.recomputes == 0
+        again, stale = precomputer.get('daily_table', '2024-01-01', '2024-12-31', None)
+        assert again is table and not stale
+    finally:
+        precomputer.close()
+
+
+def test_goal_analytics_follow_writes_to_their_rolling_lookback(db):
+    food_data.add_entry(entry('2024-03-01', 'Lunch', 'Chicken', protein=100))
+    precomputer = precompute.Precomputer(db)
+    try:
+        analytics, _ = precomputer.get('goal_analytics', 130, '2024-03-01', '2024-03-31', ())
+        assert analytics['avg_7d'] == 100
+        food_data.add_entry(entry('2024-02-29', 'Dinner', 'Steak', protein=300))
+        analytics, stale = precomputer.get('goal_analytics', 130, '2024-03-01', '2024-03-31', (), wait=5)
+        assert not stale and precomputer.recomputes == 1
+        assert analytics['avg_7d'] == food_data.get_goal_analytics(130, '2024-03-01', '2024-03-31')['avg_7d']
+        assert analytics['avg_7d'] != 100
+    finally:
+        precomputer.close()
+
+
+def test_writes_inside_the_date_range_recompute_the_artifact(db):
+    food_data.add_entry(entry('2024-03-01', 'Lunch', 'Chicken', protein=30))
+    precomputer = precompute.Precomputer(db)
+    try:
+        precomputer.get('daily_table', '2024-01-01', '2024-12-31', None)
+        food_data.add_entry(entry('2024-03-02', 'Lunch', 'Fish', protein=25))
+        table, stale = precomputer.get('daily_table', '2024-01-01', '2024-12-31', None, wait=5)
+        assert not stale
+        assert precomputer.recomputes == 1
+        assert list(table['Date']) == ['2024-03-02', '2024-03-01']
+    finally:
+        precomputer.close()
+
+
+def test_exports_are_only_rebuilt_on_request(db):
+    food_data.add_entry(entry('2024-03-01', 'Lunch', 'Chicken', protein=30))
+    precomputer = precompute.Precomputer(db)
+    try:
+        precomputer.get('csv', None, None, None)
+        food_data.add_entry(entry('2024-03-02', 'Lunch', 'Fish', protein=25))
+        settle()
+        assert precomputer.recomputes == 0
+        csv_data, stale = precomputer.get('csv', None, None, None)
+        assert b'Fish' in csv_data and not stale
+    finally:
+        precomputer.close()
+
+
+def test_goal_analytics_keep_only_recent_goals(db):
+    food_data.add_entry(entry('2024-03-01', 'Lunch', 'Chicken', protein=30))
+    precomputer = precompute.Precomputer(db)
+    try:
+        for goal in range(100, 110):
+            precomputer.get('goal_analytics', goal, None, None, None)
+        goals = [args[0] for name, args in precomputer._results if name == 'goal_analytics']
+        assert goals == [108, 109]
+    finally:
+        precomputer.close()
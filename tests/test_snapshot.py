@@ -0,0 +1,59 @@
+import os
+import sqlite3
+
+import food_data
+from conftest import entry
+
+
+def snapshot_foods(**filters):
+    return sorted(food_data.load_snapshot(columns=['food'], **filters).column('food').to_pylist())
+
+
+def test_reads_do_not_change_the_data_version(db):
+    food_data.add_entry(entry('2024-01-01', 'Lunch', 'Eggs'))
+    version = food_data.get_data_version()
+    food_data.transform_to_daily_table(categories=['Lunch'])
+    assert snapshot_foods() == ['Eggs']
+    assert food_data.get_data_version() == version
+
+
+def test_snapshot_follows_edits_across_years(db):
+    food_data.add_entry(entry('2023-06-01', 'Lunch', 'Eggs'))
+    food_data.add_entry(entry('2024-06-01', 'Dinner', 'Fish'))
+    assert snapshot_foods() == ['Eggs', 'Fish']
+    
+    fish = food_data.search_entries('Fish')[0]
+    food_data.update_entry(fish['id'], {**fish, 'date': '2023-07-01'})
+    assert snapshot_foods(start_date='2023-01-01', end_date='2023-12-31') == ['Eggs', 'Fish']
+    assert snapshot_foods(start_date='2024-01-01') == []
+    
+    eggs = food_data.search_entries('Eggs')[0]
+    food_data.delete_entry(eggs['id'])
+    assert snapshot_foods() == ['Fish']
+
+
+def test_snapshot_picks_up_writes_made_outside_the_app(db):
+    food_data.add_entry(entry('2024-01-01', 'Lunch', 'Eggs'))
+    assert snapshot_foods() == ['Eggs']
+    with sqlite3.connect(db) as conn:
+        conn.execute("UPDATE food_entries SET food = 'Omelette'")
+    assert snapshot_foods() == ['Omelette']
+
+
+def test_rebuild_snapshot(db):
+    food_data.add_entry(entry('2023-01-01', 'Lunch', 'Eggs'))
+    food_data.add_entry(entry('2024-01-01', 'Lunch', 'Fish'))
+    snapshot_foods()
+    assert food_data.rebuild_snapshot() == ['2023', '2024']
+    assert snapshot_foods() == ['Eggs', 'Fish']
+
+
+def test_only_databases_whose_snapshot_is_read_refresh_it(db):
+    food_data.add_entry(entry('2024-01-01', 'Lunch', 'Eggs'))
+    food_data._snapshot_refresher.submit(lambda: None).result()
+    assert not os.path.exists(food_data.snapshot_dir(db))
+    
+    assert snapshot_foods() == ['Eggs']
+    food_data.add_entry(entry('2025-01-01', 'Lunch', 'Fish'))
+    food_data._snapshot_refresher.submit(lambda: None).result()
+    assert os.path.exists(os.path.join(food_data.snapshot_dir(db), 'year=2025.arrow'))